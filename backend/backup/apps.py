@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class BackupConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'backup'
+
+    def ready(self):
+        import backup.signals  # noqa: F401
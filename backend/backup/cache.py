@@ -0,0 +1,107 @@
+import functools
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from backup.metrics import incr, read_stats, reset_stats
+from backup.single_flight import SingleFlight
+from backup.versions import SECTIONS, get_section_version
+
+# How often a worker waiting for another one to build an entry looks for it
+LOCK_POLL_INTERVAL = 0.05  # seconds
+
+
+# Read-through cache of the full section payloads (what a restore downloads),
+# one entry per user and section. An entry remembers the section version it was
+# built from, so it is only served while the version is unchanged; writes also
+# drop it (invalidate_section) so a stale copy does not take up space.
+
+def _cache():
+    return caches['backup']
+
+
+def section_key(user_id, section):
+    return 'section:{}:{}'.format(user_id, section)
+
+
+# Identical reads running at the same time in this process (several devices
+# relaunching together, retries) share one computation
+_flight = SingleFlight()
+
+
+def _build_entry(user, key, version, load):
+    # With BACKUP_CACHE_LOCK_TIMEOUT set, one worker across processes builds the
+    # entry; the others wait for it to show up in the cache, and build it
+    # themselves only if it does not within the timeout
+    cache = _cache()
+    timeout = settings.BACKUP_CACHE_LOCK_TIMEOUT
+    lock_key = key + ':lock'
+    locked = bool(timeout) and cache.add(lock_key, 1, timeout=timeout)
+
+    if timeout and not locked:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None and entry[0] >= version:
+                return entry[1]
+
+    try:
+        payload = load(user)
+        cache.set(key, (version, payload))
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return payload
+
+
+def cached_section(section):
+    # Decorator for the section readers get_<section>(user, since=None, **options):
+    # full reads of the BACKUP_CACHE_SECTIONS are served from the cache, delta
+    # (since) and binary reads are not. Concurrent identical reads of any kind
+    # are coalesced.
+    def decorator(load):
+        @functools.wraps(load)
+        def read(user, since=None, **options):
+            key = section_key(user.id, section)
+            version = get_section_version(user, section)
+            if since is not None or any(options.values()):
+                # With the version, a read started after a write does not join one
+                # that began before it and may return the older rows
+                flight_key = (section, user.id, version, since, tuple(sorted(options.items())))
+                return _flight.do(flight_key, lambda: load(user, since, **options))
+
+            if section not in settings.BACKUP_CACHE_SECTIONS:
+                return _flight.do((key, version), lambda: load(user))
+
+            cache = _cache()
+            entry = cache.get(key)
+            if entry is not None and entry[0] == version:
+                incr('cache', section, 'hits')
+                return entry[1]
+
+            incr('cache', section, 'misses')
+            return _flight.do((key, version), lambda: _build_entry(user, key, version, load))
+        return read
+    return decorator
+
+
+def invalidate_section(user_id, section):
+    # Now, and again once the write commits in case a reader cached the old rows in between
+    key = section_key(user_id, section)
+    _cache().delete(key)
+    transaction.on_commit(lambda: _cache().delete(key))
+
+
+def invalidate_user(user_id):
+    _cache().delete_many([section_key(user_id, section) for section in SECTIONS])
+
+
+def cache_stats():
+    return read_stats('cache', SECTIONS, ('hits', 'misses'))
+
+
+def reset_cache_stats():
+    reset_stats('cache', SECTIONS, ('hits', 'misses'))
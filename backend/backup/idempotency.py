@@ -0,0 +1,86 @@
+import datetime
+import functools
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from backup.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+class RequestInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being handled'
+    default_code = 'request_in_progress'
+
+
+def _claim(user, key, path):
+    # Returns (record, None) when this request is the one to run, or
+    # (None, record) with the stored outcome of an earlier one
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, path=path, created_at=now), None
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.get(user=user, key=key)
+    expired = record.created_at < now - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    # A request that died without recording its outcome does not hold the key forever
+    abandoned = record.status_code is None and \
+        record.created_at < now - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_PENDING_TIMEOUT)
+
+    if expired or abandoned:
+        # Taken over with a conditional update, so only one of several retries runs
+        taken = IdempotencyKey.objects.filter(id=record.id, created_at=record.created_at).update(
+            path=path, status_code=None, response=None, created_at=now)
+        if taken:
+            record.created_at = now
+            return record, None
+        record.refresh_from_db()
+
+    if record.path != path:
+        raise ValidationError({HEADER: ["Already used for another request"]})
+    if record.status_code is None:
+        raise RequestInProgress()
+    return None, record
+
+
+def idempotent(post):
+    # For the backup POST handlers: with an Idempotency-Key header, the outcome of
+    # the first successful request is stored for IDEMPOTENCY_KEY_TTL seconds and
+    # replayed to retries carrying the same key, which are not run again. A request
+    # that fails frees the key, so it can be retried as is.
+    @functools.wraps(post)
+    def handler(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return post(self, request, *args, **kwargs)
+        if len(key) > 255:
+            raise ValidationError({HEADER: ["Ensure this value has at most 255 characters"]})
+
+        record, done = _claim(request.user, key, request.path)
+        if done is not None:
+            response = Response(done.response, status=done.status_code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = post(self, request, *args, **kwargs)
+        except BaseException:
+            record.delete()
+            raise
+
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            record.status_code = response.status_code
+            record.response = response.data
+            record.save(update_fields=['status_code', 'response'])
+        return response
+    return handler
@@ -0,0 +1,92 @@
+import contextlib
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from backup.metrics import incr
+
+logger = logging.getLogger(__name__)
+
+# MySQL: lock wait timeout, deadlock; PostgreSQL: serialization_failure, deadlock_detected
+RETRYABLE_ERROR_CODES = (1205, 1213)
+RETRYABLE_SQLSTATES = ('40001', '40P01')
+
+# Waits for a section lock longer than this are logged
+SLOW_LOCK_WAIT = 1.0  # seconds
+
+LOCK_STATS = ('waits', 'wait_ms', 'retries', 'conflicts')
+
+
+class WriteConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The backup collided with a write from another device, try again'
+    default_code = 'write_conflict'
+
+
+@contextlib.contextmanager
+def lock_wait(section):
+    # Times the select_for_update of a section's lock row (see lock_section_version)
+    started = time.monotonic()
+    yield
+    waited = time.monotonic() - started
+    incr('lock', section, 'waits')
+    incr('lock', section, 'wait_ms', int(waited * 1000))
+    if waited > SLOW_LOCK_WAIT:
+        logger.warning('Waited %.2fs for the %s lock', waited, section)
+
+
+_writing = threading.local()
+
+
+@contextlib.contextmanager
+def section_write():
+    # Marks the writes of the section functions, which keep the section versions,
+    # tombstones and cache themselves: the post_delete receivers in backup.signals
+    # leave the rows they delete alone
+    _writing.depth = getattr(_writing, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _writing.depth -= 1
+
+
+def in_section_write():
+    return getattr(_writing, 'depth', 0) > 0
+
+
+def is_retryable(error):
+    cause = error.__cause__ or error
+    if getattr(cause, 'pgcode', None) in RETRYABLE_SQLSTATES:
+        return True
+    return bool(cause.args) and cause.args[0] in RETRYABLE_ERROR_CODES
+
+
+def atomic_with_retry(section, write):
+    # Runs write() in a transaction, again when the database aborted it as a deadlock
+    # victim or serialization failure, BACKUP_WRITE_ATTEMPTS times at most. Nested in
+    # another transaction it runs once: only the outermost one can be retried.
+    if connection.in_atomic_block:
+        with transaction.atomic(), section_write():
+            return write()
+
+    attempts = settings.BACKUP_WRITE_ATTEMPTS
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic(), section_write():
+                return write()
+        except DatabaseError as e:
+            if not is_retryable(e):
+                raise
+            if attempt + 1 == attempts:
+                incr('lock', section, 'conflicts')
+                logger.warning('Giving up the %s write after %d attempts: %s', section, attempts, e)
+                raise WriteConflict()
+            incr('lock', section, 'retries')
+            time.sleep(0.05 * 2 ** attempt + random.uniform(0, 0.05))
+
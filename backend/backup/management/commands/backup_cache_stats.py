@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from backup.cache import cache_stats, reset_cache_stats
+
+
+# python manage.py backup_cache_stats [--reset]
+class Command(BaseCommand):
+    help = 'Show the hit and miss counts of the cached backup payloads, per section'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Start counting from zero again')
+
+    def handle(self, *args, **options):
+        for section, counts in cache_stats().items():
+            total = counts['hits'] + counts['misses']
+            ratio = counts['hits'] / total if total else 0
+            self.stdout.write('{} hits={} misses={} hit_ratio={:.2f}'.format(
+                section, counts['hits'], counts['misses'], ratio))
+
+        if options['reset']:
+            reset_cache_stats()
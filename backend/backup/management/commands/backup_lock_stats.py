@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from backup.locking import LOCK_STATS
+from backup.metrics import read_stats, reset_stats
+from backup.versions import SECTIONS
+from backup.views import BUNDLE
+
+
+# python manage.py backup_lock_stats [--reset]
+class Command(BaseCommand):
+    help = 'Show how long backup writes waited for their section locks and how often they were retried'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Start counting from zero again')
+
+    def handle(self, *args, **options):
+        sections = SECTIONS + (BUNDLE,)
+        for section, counts in read_stats('lock', sections, LOCK_STATS).items():
+            average = counts['wait_ms'] / counts['waits'] if counts['waits'] else 0
+            self.stdout.write('{} waits={} avg_wait_ms={:.1f} retries={} conflicts={}'.format(
+                section, counts['waits'], average, counts['retries'], counts['conflicts']))
+
+        if options['reset']:
+            reset_stats('lock', sections, LOCK_STATS)
@@ -0,0 +1,27 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backup.models import IdempotencyKey
+
+BATCH_SIZE = 1000
+
+
+# Meant to run periodically (e.g. from cron): python manage.py purge_idempotency_keys
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key outcomes older than IDEMPOTENCY_KEY_TTL'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        expired = IdempotencyKey.objects.filter(created_at__lt=cutoff)
+
+        deleted = 0
+        while True:
+            ids = list(expired.values_list('id', flat=True)[:BATCH_SIZE])
+            if not ids:
+                break
+            deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write('idempotency_keys_deleted={}'.format(deleted))
@@ -0,0 +1,15 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backup.sync import purge_tombstones
+
+
+# Meant to run periodically (e.g. from cron): python manage.py purge_tombstones
+class Command(BaseCommand):
+    help = 'Delete tombstones older than TOMBSTONE_RETENTION; delta syncs from before them restore in full'
+
+    def handle(self, *args, **options):
+        deleted = purge_tombstones(datetime.timedelta(seconds=settings.TOMBSTONE_RETENTION))
+        self.stdout.write('tombstones_deleted={}'.format(deleted))
@@ -0,0 +1,100 @@
+import hashlib
+
+from backup.models import SectionManifest
+from backup.versions import FAVORITES, SECTIONS, SETTINGS, SYMBOLS, get_section_version
+from entry.models import FavoriteSymbol, Symbol
+from setup.models import Setting
+from weight_table.defaults import merge_with_defaults
+from weight_table.models import WeightTable
+
+# The hash of a section is the sum, modulo 2**128, of the hashes of its rows
+# (the first 16 bytes of the sha256 of a row's canonical text). It does not
+# depend on the order of the rows, and a write updates it by adding and
+# subtracting the rows it changed instead of reading the whole section.
+# Canonical rows, for clients to compute the same hash from their local copy:
+#   favorites, symbols: the symbol id, e.g. "501"
+#   settings: "display_mode,default_menu,auto_backup", e.g. "1,0,1" (none before the first backup)
+#   weights: every row of the full table as "id:[v,v,...]" without trailing zeros, e.g. "1:[0,10]"
+HASH_MODULUS = 2 ** 128
+
+
+def row_hash(row):
+    return int.from_bytes(hashlib.sha256(row.encode()).digest()[:16], 'big')
+
+
+def symbol_row(symbol_id):
+    return str(symbol_id)
+
+
+def settings_row(setting):
+    return '{},{},{}'.format(setting.display_mode, setting.default_menu, setting.auto_backup)
+
+
+def weight_row(symbol_id, weight):
+    values = list(weight)
+    while values and values[-1] == 0:
+        values.pop()
+    return '{}:[{}]'.format(symbol_id, ','.join(map(str, values)))
+
+
+def _format_hash(value):
+    return '{:032x}'.format(value % HASH_MODULUS)
+
+
+def _section_rows(user, section):
+    if section == FAVORITES:
+        return [symbol_row(symbol_id) for symbol_id in
+                FavoriteSymbol.objects.filter(user=user).values_list('symbol_id', flat=True)]
+    if section == SYMBOLS:
+        return [symbol_row(symbol_id) for symbol_id in
+                Symbol.objects.filter(created_by=user, is_valid=True).values_list('id', flat=True)]
+    if section == SETTINGS:
+        return [settings_row(setting) for setting in Setting.objects.filter(user=user)]
+    overrides = dict(WeightTable.objects.filter(user=user).values_list('symbol_id', 'weight'))
+    return [weight_row(symbol_id, weight) for symbol_id, weight in merge_with_defaults(overrides)]
+
+
+# For the section writers, inside their transaction and holding the section's
+# lock; `version` is the section version the write produced. A manifest that
+# was not at the version before is left alone: it is computed again when read.
+
+def update_manifest(user, section, version, added=(), removed=()):
+    manifest = SectionManifest.objects.select_for_update().filter(
+        user=user, section=section, version=version - 1).first()
+    if manifest is None:
+        return
+
+    value = int(manifest.content_hash, 16) + sum(map(row_hash, added)) - sum(map(row_hash, removed))
+    manifest.content_hash = _format_hash(value)
+    manifest.row_count += len(added) - len(removed)
+    manifest.version = version
+    manifest.save(update_fields=['content_hash', 'row_count', 'version'])
+
+
+def replace_manifest(user, section, version, rows):
+    # for sections rewritten as a whole (settings, a single row)
+    SectionManifest.objects.filter(user=user, section=section, version=version - 1).update(
+        content_hash=_format_hash(sum(map(row_hash, rows))), row_count=len(rows), version=version)
+
+
+def get_manifest(user):
+    manifests = {manifest.section: manifest for manifest in SectionManifest.objects.filter(user=user)}
+
+    response_data = {}
+    for section in SECTIONS:
+        version = get_section_version(user, section)
+        manifest = manifests.get(section)
+        if manifest is None or manifest.version != version:
+            # First read, or a write the manifest missed: computed from the rows once
+            rows = _section_rows(user, section)
+            manifest, _ = SectionManifest.objects.update_or_create(user=user, section=section, defaults={
+                'version': version,
+                'content_hash': _format_hash(sum(map(row_hash, rows))),
+                'row_count': len(rows),
+            })
+        response_data[section] = {
+            "hash": manifest.content_hash,
+            "count": manifest.row_count,
+            "cursor": version
+        }
+    return response_data
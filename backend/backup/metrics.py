@@ -0,0 +1,31 @@
+from django.core.cache import caches
+
+
+# Per-section counters (cache hits, lock waits, ...) kept in the backup cache,
+# so with a shared backend they add up over every worker
+
+def _key(kind, section, name):
+    return 'stats:{}:{}:{}'.format(kind, section, name)
+
+
+def incr(kind, section, name, amount=1):
+    cache = caches['backup']
+    key = _key(kind, section, name)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, amount)
+
+
+def read_stats(kind, sections, names):
+    keys = [_key(kind, section, name) for section in sections for name in names]
+    values = caches['backup'].get_many(keys)
+    return {
+        section: {name: values.get(_key(kind, section, name), 0) for name in names}
+        for section in sections
+    }
+
+
+def reset_stats(kind, sections, names):
+    caches['backup'].delete_many([_key(kind, section, name) for section in sections for name in names])
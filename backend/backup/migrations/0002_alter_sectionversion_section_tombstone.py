@@ -0,0 +1,35 @@
+# Generated by Django 4.2.5 on 2026-10-18 09:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('backup', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sectionversion',
+            name='section',
+            field=models.CharField(choices=[('favorites', 'favorites'), ('symbols', 'symbols'), ('settings', 'settings'), ('weights', 'weights')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section', models.CharField(choices=[('favorites', 'favorites'), ('symbols', 'symbols'), ('settings', 'settings'), ('weights', 'weights')], max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('version', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tombstones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'section', 'version'], name='tombstone_user_section_version')],
+            },
+        ),
+    ]
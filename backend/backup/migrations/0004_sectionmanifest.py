@@ -0,0 +1,31 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('backup', '0003_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SectionManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section', models.CharField(choices=[('favorites', 'favorites'), ('symbols', 'symbols'), ('settings', 'settings'), ('weights', 'weights')], max_length=20)),
+                ('version', models.BigIntegerField()),
+                ('content_hash', models.CharField(max_length=32)),
+                ('row_count', models.IntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='section_manifests', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sectionmanifest',
+            constraint=models.UniqueConstraint(fields=('user', 'section'), name='unique_section_manifest_per_user'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('backup', '0004_sectionmanifest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TombstoneHorizon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section', models.CharField(choices=[('favorites', 'favorites'), ('symbols', 'symbols'), ('settings', 'settings'), ('weights', 'weights')], max_length=20)),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['created_at'], name='tombstone_created_at'),
+        ),
+        migrations.AddField(
+            model_name='tombstonehorizon',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tombstone_horizons', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='tombstonehorizon',
+            constraint=models.UniqueConstraint(fields=('user', 'section'), name='unique_tombstone_horizon_per_user'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+from django.db import models
+
+
+SECTION_CHOICE = (
+    ('favorites', 'favorites'),
+    ('symbols', 'symbols'),
+    ('settings', 'settings'),
+    ('weights', 'weights'),
+)
+
+
+# Change counter of one backup section of a user, bumped by every write that
+# changes what the section's GET returns (see backup.versions). The weight
+# table keeps its own counter in weight_table.WeightTableVersion.
+class SectionVersion(models.Model):
+    user = models.ForeignKey('user.User', related_name='section_versions', on_delete=models.CASCADE)
+    section = models.CharField(max_length=20, choices=SECTION_CHOICE)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'section'], name='unique_section_version_per_user'),
+        ]
+
+
+# Row removed from a section, kept so that a delta sync (see backup.sync) can
+# report the deletion. `version` is the section version of the removal.
+class Tombstone(models.Model):
+    user = models.ForeignKey('user.User', related_name='tombstones', on_delete=models.CASCADE)
+    section = models.CharField(max_length=20, choices=SECTION_CHOICE)
+    object_id = models.IntegerField()  # symbol id
+    version = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'section', 'version'], name='tombstone_user_section_version'),
+            models.Index(fields=['created_at'], name='tombstone_created_at'),
+        ]
+
+
+# Highest section version whose tombstones were purged (backup.sync.purge_tombstones):
+# a delta sync from an older cursor could miss deletions and must restore in full
+class TombstoneHorizon(models.Model):
+    user = models.ForeignKey('user.User', related_name='tombstone_horizons', on_delete=models.CASCADE)
+    section = models.CharField(max_length=20, choices=SECTION_CHOICE)
+    version = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'section'], name='unique_tombstone_horizon_per_user'),
+        ]
+
+
+# Content hash and row count of one backup section of a user, kept up to date
+# by the section writers (see backup.manifest). `version` is the section version
+# they describe; a manifest behind the section is computed again when read.
+class SectionManifest(models.Model):
+    user = models.ForeignKey('user.User', related_name='section_manifests', on_delete=models.CASCADE)
+    section = models.CharField(max_length=20, choices=SECTION_CHOICE)
+    version = models.BigIntegerField()
+    content_hash = models.CharField(max_length=32)
+    row_count = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'section'], name='unique_section_manifest_per_user'),
+        ]
+
+
+# Outcome of a POST sent with an Idempotency-Key header, replayed to retries of
+# the same request instead of running it again (see backup.idempotency).
+# `status_code` stays null while the first request is being handled.
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey('user.User', related_name='idempotency_keys', on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    path = models.CharField(max_length=255)  # endpoint the key was first used on
+    status_code = models.IntegerField(null=True)
+    response = models.JSONField(null=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_key_created_at'),
+        ]
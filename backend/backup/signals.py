@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from backup.cache import invalidate_section, invalidate_user
+from backup.locking import in_section_write
+from backup.sync import record_tombstones
+from backup.versions import FAVORITES, SETTINGS, SYMBOLS, WEIGHTS, bump_section_version
+from entry.models import FavoriteSymbol, Symbol
+from setup.models import Setting
+from user.models import User
+from weight_table.models import WeightTable
+from weight_table.views import bump_weight_table_version, lock_weight_table
+
+
+# Writes that do not go through the section functions (admin, shell, other apps)
+# still drop the cached payloads. Rows of symbols, favorites and weights deleted
+# that way also move the section version and leave a tombstone, so ETags and
+# delta syncs notice; the section functions do that themselves (section_write).
+
+@receiver(post_save, sender=Setting)
+@receiver(post_delete, sender=Setting)
+def invalidate_settings(sender, instance, **kwargs):
+    invalidate_section(instance.user_id, SETTINGS)
+
+
+@receiver(post_save, sender=Symbol)
+def invalidate_symbols(sender, instance, **kwargs):
+    if instance.created_by_id is not None:
+        invalidate_section(instance.created_by_id, SYMBOLS)
+
+
+@receiver(post_save, sender=FavoriteSymbol)
+def invalidate_favorites(sender, instance, **kwargs):
+    invalidate_section(instance.user_id, FAVORITES)
+
+
+@receiver(post_save, sender=WeightTable)
+def invalidate_weights(sender, instance, **kwargs):
+    invalidate_section(instance.user_id, WEIGHTS)
+
+
+def _deleted(user_id, section, object_id, origin):
+    # The account itself going away takes its versions and cache with it
+    if in_section_write() or isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    user = User.objects.filter(id=user_id).first()
+    if user is None:
+        return
+
+    with transaction.atomic():
+        if section == WEIGHTS:
+            version = bump_weight_table_version(user, lock_weight_table(user))
+        else:
+            version = bump_section_version(user, section)
+            invalidate_section(user_id, section)
+        record_tombstones(user, section, [object_id], version)
+
+
+@receiver(post_delete, sender=Symbol)
+def symbol_deleted(sender, instance, origin=None, **kwargs):
+    # Symbols that were never enabled are not part of the section
+    if instance.created_by_id is not None and instance.is_valid:
+        _deleted(instance.created_by_id, SYMBOLS, instance.id, origin)
+
+
+@receiver(post_delete, sender=FavoriteSymbol)
+def favorite_deleted(sender, instance, origin=None, **kwargs):
+    _deleted(instance.user_id, FAVORITES, instance.symbol_id, origin)
+
+
+@receiver(post_delete, sender=WeightTable)
+def weight_deleted(sender, instance, origin=None, **kwargs):
+    _deleted(instance.user_id, WEIGHTS, instance.symbol_id, origin)
+
+
+@receiver(post_save, sender=User)
+def invalidate_new_user(sender, instance, created, **kwargs):
+    # The id of a deleted account can be handed out again (InnoDB recomputes
+    # AUTO_INCREMENT on restart), and cached entries outlive the database rows
+    if created:
+        invalidate_user(instance.id)
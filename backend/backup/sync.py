@@ -0,0 +1,73 @@
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from backup.models import Tombstone, TombstoneHorizon
+
+# Delta sync: rows carry the section version of their last change and removed
+# rows leave a Tombstone. The GET of a section returns its current version as
+# `cursor`; passing it back as ?since= returns only what changed after it.
+# Tombstones are kept TOMBSTONE_RETENTION seconds; older cursors get an error
+# and the client restores the section in full.
+
+PURGE_BATCH_SIZE = 1000
+
+
+def parse_since(request):
+    since = request.query_params.get('since')
+    if since is None:
+        return None
+
+    try:
+        since = int(since)
+    except ValueError:
+        raise ValidationError({"since": ["Invalid cursor"]})
+    if since < 0:
+        raise ValidationError({"since": ["Invalid cursor"]})
+    return since
+
+
+def check_cursor(user, section, since, cursor):
+    if since is None:
+        return
+    # A cursor ahead of the section was not issued for this account
+    if since > cursor:
+        raise ValidationError({"since": ["Invalid cursor"]})
+    horizon = TombstoneHorizon.objects.filter(user=user, section=section).values_list('version', flat=True).first()
+    if horizon is not None and since < horizon:
+        raise ValidationError({"since": ["Expired cursor, restore the section in full"]})
+
+
+def record_tombstones(user, section, object_ids, version):
+    Tombstone.objects.bulk_create([
+        Tombstone(user=user, section=section, object_id=object_id, version=version)
+        for object_id in object_ids
+    ])
+
+
+def deleted_since(user, section, since):
+    tombstones = Tombstone.objects.filter(user=user, section=section, version__gt=since)
+    return set(tombstones.values_list('object_id', flat=True))
+
+
+def purge_tombstones(older_than):
+    cutoff = timezone.now() - older_than
+    expired = Tombstone.objects.filter(created_at__lt=cutoff)
+
+    deleted = 0
+    while True:
+        batch = list(expired.values_list('id', 'user_id', 'section', 'version')[:PURGE_BATCH_SIZE])
+        if not batch:
+            return deleted
+
+        horizons = {}
+        for _, user_id, section, version in batch:
+            horizons[user_id, section] = max(version, horizons.get((user_id, section), 0))
+        # The horizon moves in the transaction that deletes the tombstones below it
+        with transaction.atomic():
+            for (user_id, section), version in horizons.items():
+                horizon, created = TombstoneHorizon.objects.get_or_create(
+                    user_id=user_id, section=section, defaults={'version': version})
+                if not created:
+                    TombstoneHorizon.objects.filter(id=horizon.id, version__lt=version).update(version=version)
+            deleted += Tombstone.objects.filter(id__in=[id for id, _, _, _ in batch]).delete()[0]
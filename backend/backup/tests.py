@@ -0,0 +1,586 @@
+import datetime
+import json
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+
+from backup.cache import cache_stats, reset_cache_stats, section_key
+from backup.locking import LOCK_STATS, WriteConflict, atomic_with_retry
+from backup.manifest import HASH_MODULUS, row_hash
+from backup.metrics import read_stats, reset_stats
+from backup.models import IdempotencyKey, SectionManifest, SectionVersion, Tombstone
+from backup.single_flight import SingleFlight
+from backup.versions import SECTIONS
+from entry.models import FavoriteSymbol, Symbol
+from entry.views import backup_favorites
+from setup.models import Setting
+from user.models import User
+from weight_table.codec import decode_weight
+from weight_table.defaults import load_default_weights
+from weight_table.models import WeightTable
+
+
+class BundleTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test_email@gmail.com',
+            password='test_password',
+            nickname='test_nickname'
+        )
+        self.tokens = self.login_and_get_tokens()
+        self.access_token = self.tokens.get('access')
+        self.refresh_token = self.tokens.get('refresh')
+
+        Symbol.objects.create(id=1, text="default1", category=1)
+        Symbol.objects.create(id=501, text="test1", category=1, created_by=self.user)
+        Symbol.objects.create(id=502, text="test2", category=2, created_by=self.user)
+
+    def login_and_get_tokens(self):
+        data = {
+            'email': 'test_email@gmail.com',
+            'password': 'test_password',
+        }
+        response = self.client.post('/user/login/', data)
+        if response.status_code == status.HTTP_200_OK:
+            tokens = response.json()
+            return tokens
+        return None
+
+    def get_bundle(self, url='/backup/bundle/', **extra):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        response = self.client.get(url, **headers, **extra)
+        if response.status_code != status.HTTP_200_OK:
+            return response, None
+        return response, json.loads(b''.join(response.streaming_content))
+
+    def test_post_bundle_success(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        data = {
+            'settings': {'display_mode': 1, 'default_menu': 0, 'auto_backup': 1},
+            'symbols': {'id': [501, 502]},
+            'favorites': {'id': [1, 502]},
+            'weights': {'weight_table': [{'id': 1, 'weight': '[0,10,0]'}]},
+        }
+        response = self.client.post('/backup/bundle/', data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json().get('cursors'), {'symbols': 1, 'favorites': 1, 'weights': 1, 'settings': 1})
+
+        self.assertEqual(Setting.objects.get(user=self.user).display_mode, 1)
+        self.assertEqual(Symbol.objects.filter(created_by=self.user, is_valid=True).count(), 2)
+        self.assertEqual(sorted(FavoriteSymbol.objects.filter(user=self.user).values_list('symbol_id', flat=True)),
+                         [1, 502])
+        self.assertEqual(decode_weight(WeightTable.objects.get(user=self.user).weight), [0, 10, 0])
+
+    def test_post_bundle_fail_rolls_back_all_sections(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        data = {
+            'favorites': {'id': [1]},
+            'weights': {'weight_table': [{'id': 1, 'weight': '[0,ten,0]'}]},
+        }
+        response = self.client.post('/backup/bundle/', data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('weights', response.json()['error']['message'])
+        self.assertFalse(FavoriteSymbol.objects.filter(user=self.user).exists())
+
+    def test_post_bundle_fail_unknown_section(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        response = self.client.post('/backup/bundle/', {'photos': {}}, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_bundle_success(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.post('/symbol/enable/?id=501', **headers)
+        self.client.post('/symbol/favorite/backup/?id=501', **headers)
+
+        response, bundle = self.get_bundle()
+        self.assertTrue(response.streaming)
+        self.assertEqual(list(bundle), ['settings', 'favorites', 'symbols', 'weights'])
+        self.assertEqual(bundle['settings']['display_mode'], 0)
+        self.assertEqual(bundle['favorites']['results'], [{'id': 501}])
+        self.assertEqual([symbol['id'] for symbol in bundle['symbols']['my_symbols']], [501])
+        self.assertEqual(len(bundle['weights']['weight_table']), len(load_default_weights()))
+
+        # unchanged since the last restore
+        response, _ = self.get_bundle(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_get_bundle_selected_sections(self):
+        response, bundle = self.get_bundle('/backup/bundle/?sections=weights,settings')
+        self.assertEqual(list(bundle), ['settings', 'weights'])
+
+        response, _ = self.get_bundle('/backup/bundle/?sections=photos')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SectionCacheTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test_email@gmail.com',
+            password='test_password',
+            nickname='test_nickname'
+        )
+        self.tokens = self.login_and_get_tokens()
+        self.access_token = self.tokens.get('access')
+        self.refresh_token = self.tokens.get('refresh')
+
+        Symbol.objects.create(id=1, text="default1", category=1)
+        Symbol.objects.create(id=2, text="default2", category=1)
+        reset_cache_stats()
+
+    def login_and_get_tokens(self):
+        data = {
+            'email': 'test_email@gmail.com',
+            'password': 'test_password',
+        }
+        response = self.client.post('/user/login/', data)
+        if response.status_code == status.HTTP_200_OK:
+            tokens = response.json()
+            return tokens
+        return None
+
+    def test_repeated_restore_served_from_cache(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.post('/symbol/favorite/backup/?id=1', **headers)
+
+        response = self.client.get('/symbol/favorite/backup/', **headers)
+        self.assertEqual(response.json().get('results'), [{'id': 1}])
+
+        # etag, user, section version; the favorites themselves are not read again
+        with self.assertNumQueries(3):
+            response = self.client.get('/symbol/favorite/backup/', **headers)
+        self.assertEqual(response.json().get('results'), [{'id': 1}])
+        self.assertEqual(cache_stats()['favorites'], {'hits': 1, 'misses': 1})
+
+    @override_settings(BACKUP_CACHE_SECTIONS=SECTIONS)
+    def test_post_invalidates_cached_section(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.post('/symbol/favorite/backup/?id=1', **headers)
+        self.client.get('/symbol/favorite/backup/', **headers)
+
+        self.client.post('/symbol/favorite/backup/?id=2', **headers)
+        response = self.client.get('/symbol/favorite/backup/', **headers)
+        self.assertEqual(response.json().get('results'), [{'id': 2}])
+
+        data = {'weight_table': [{'id': 1, 'weight': '[0,10,0]'}]}
+        self.client.get('/weight/backup/', **headers)
+        self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+        response = self.client.get('/weight/backup/', **headers)
+        self.assertIn({'id': 1, 'weight': '[0,10,0]'}, response.json().get('weight_table'))
+        self.assertEqual(cache_stats()['weights'], {'hits': 0, 'misses': 2})
+
+    @override_settings(BACKUP_CACHE_SECTIONS=('settings', 'favorites', 'symbols'))
+    def test_sections_left_out_are_not_cached(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.get('/weight/backup/', **headers)
+        response = self.client.get('/weight/backup/', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(caches['backup'].get(section_key(self.user.id, 'weights')))
+        self.assertEqual(cache_stats()['weights'], {'hits': 0, 'misses': 0})
+
+    def test_delta_reads_across_a_write_are_not_coalesced(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.post('/symbol/favorite/backup/?id=1', **headers)
+        with mock.patch('backup.cache._flight.do', side_effect=lambda key, compute: compute()) as do:
+            self.client.get('/symbol/favorite/backup/?since=0', **headers)
+            self.client.post('/symbol/favorite/backup/?id=2', **headers)
+            self.client.get('/symbol/favorite/backup/?since=0', **headers)
+        first, second = [call.args[0] for call in do.call_args_list]
+        self.assertNotEqual(first, second)
+
+    def test_model_save_invalidates_cached_section(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        response = self.client.get('/setting/backup/', **headers)
+        self.assertEqual(response.json().get('display_mode'), 0)
+
+        # e.g. from the admin: no section version bump
+        Setting.objects.create(user=self.user, display_mode=1, default_menu=0, auto_backup=0)
+        response = self.client.get('/setting/backup/', **headers)
+        self.assertEqual(response.json().get('display_mode'), 1)
+
+    def test_model_delete_moves_section_version(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.post('/symbol/favorite/backup/?id=1,2', **headers)
+        response = self.client.get('/symbol/favorite/backup/', **headers)
+        cursor, etag = response.json().get('cursor'), response['ETag']
+
+        # e.g. from the admin or a shell
+        FavoriteSymbol.objects.get(user=self.user, symbol_id=1).delete()
+        response = self.client.get('/symbol/favorite/backup/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json().get('results'), [{'id': 2}])
+        response = self.client.get('/symbol/favorite/backup/?since={}'.format(cursor), **headers)
+        self.assertEqual(response.json().get('deleted'), [1])
+
+        # the API's own deletes are versioned once, by the section function
+        self.client.post('/symbol/favorite/backup/?id=', **headers)
+        self.assertEqual(self.client.get('/symbol/favorite/backup/', **headers).json().get('cursor'), cursor + 2)
+
+        # nor does deleting the account recreate its versions
+        self.client.post('/symbol/favorite/backup/?id=1', **headers)
+        self.user.delete()
+        self.assertFalse(SectionVersion.objects.exists())
+
+    @override_settings(BACKUP_CACHE_LOCK_TIMEOUT=0.2)
+    def test_restore_while_other_process_holds_lock(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        # another worker is building the entry and never stores it
+        lock_key = section_key(self.user.id, 'symbols') + ':lock'
+        caches['backup'].add(lock_key, 1, timeout=60)
+        self.addCleanup(caches['backup'].delete, lock_key)
+
+        response = self.client.get('/symbol/', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json().get('my_symbols'), [])
+
+    def test_cache_stats_command(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.get('/setting/backup/', **headers)
+        self.client.get('/setting/backup/', **headers)
+
+        out = StringIO()
+        call_command('backup_cache_stats', '--reset', stdout=out)
+        self.assertIn('settings hits=1 misses=1 hit_ratio=0.50', out.getvalue())
+        self.assertEqual(cache_stats()['settings'], {'hits': 0, 'misses': 0})
+
+
+class SingleFlightTest(SimpleTestCase):
+
+    def test_concurrent_calls_share_one_computation(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        computed = []
+        results = []
+
+        def compute():
+            computed.append(1)
+            release.wait(5)
+            return {'weight_table': []}
+
+        threads = [threading.Thread(target=lambda: results.append(flight.do('key', compute))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        # wait until the other two joined the first call
+        deadline = time.monotonic() + 5
+        while flight.waiters('key') < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(computed), 1)
+        self.assertEqual(results, [{'weight_table': []}] * 3)
+        self.assertIs(results[0], results[1])
+
+        # the next call computes again
+        release.set()
+        flight.do('key', compute)
+        self.assertEqual(len(computed), 2)
+
+    def test_error_is_shared_with_waiters(self):
+        flight = SingleFlight()
+
+        def compute():
+            raise ValueError('broken')
+
+        with self.assertRaises(ValueError):
+            flight.do('key', compute)
+        self.assertEqual(flight.waiters('key'), 0)
+
+
+class WriteRetryTest(TransactionTestCase):
+
+    def setUp(self):
+        reset_stats('lock', ['favorites'], LOCK_STATS)
+
+    def deadlocking_write(self, failures):
+        calls = []
+
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(1213, 'Deadlock found when trying to get lock; try restarting transaction')
+            return len(calls)
+        return write
+
+    def test_retry_after_deadlock(self):
+        self.assertEqual(atomic_with_retry('favorites', self.deadlocking_write(2)), 3)
+        self.assertEqual(read_stats('lock', ['favorites'], LOCK_STATS)['favorites']['retries'], 2)
+
+    @override_settings(BACKUP_WRITE_ATTEMPTS=2)
+    def test_conflict_after_last_attempt(self):
+        with self.assertRaises(WriteConflict), self.assertLogs('backup.locking', 'WARNING'):
+            atomic_with_retry('favorites', self.deadlocking_write(2))
+        stats = read_stats('lock', ['favorites'], LOCK_STATS)['favorites']
+        self.assertEqual((stats['retries'], stats['conflicts']), (1, 1))
+
+    def test_other_errors_are_not_retried(self):
+        def write():
+            raise OperationalError('no such table: nothing')
+
+        with self.assertRaises(OperationalError):
+            atomic_with_retry('favorites', write)
+        self.assertEqual(read_stats('lock', ['favorites'], LOCK_STATS)['favorites']['retries'], 0)
+
+    def test_lock_waits_are_counted(self):
+        user = User.objects.create_user(email='test_email@gmail.com', password='test_password',
+                                        nickname='test_nickname')
+        Symbol.objects.create(id=1, text="default1", category=1)
+        backup_favorites(user, [1])
+
+        out = StringIO()
+        call_command('backup_lock_stats', stdout=out)
+        self.assertIn('favorites waits=1 ', out.getvalue())
+
+
+class IdempotencyKeyTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test_email@gmail.com',
+            password='test_password',
+            nickname='test_nickname'
+        )
+        self.tokens = self.login_and_get_tokens()
+        self.access_token = self.tokens.get('access')
+        self.refresh_token = self.tokens.get('refresh')
+
+    def login_and_get_tokens(self):
+        data = {
+            'email': 'test_email@gmail.com',
+            'password': 'test_password',
+        }
+        response = self.client.post('/user/login/', data)
+        if response.status_code == status.HTTP_200_OK:
+            tokens = response.json()
+            return tokens
+        return None
+
+    def test_retry_is_replayed(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}',
+            'HTTP_IDEMPOTENCY_KEY': 'increment-1',
+        }
+        data = {'increments': [{'from_symbol': 1, 'to_symbol': 3, 'delta': 10}]}
+        response = self.client.post('/weight/increment/', data, content_type='application/json', **headers)
+        self.assertEqual(response.json().get('version'), 1)
+
+        # the connection dropped before the client saw the answer
+        response = self.client.post('/weight/increment/', data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json().get('version'), 1)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+        row = decode_weight(WeightTable.objects.get(user=self.user, symbol_id=1).weight)
+        self.assertEqual(row[2], load_default_weights()[1][2] + 10)
+
+    def test_failed_request_frees_key(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}',
+            'HTTP_IDEMPOTENCY_KEY': 'settings-1',
+        }
+        response = self.client.post('/setting/backup/', {'display_mode': 5}, **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        data = {'display_mode': 1, 'default_menu': 0, 'auto_backup': 1}
+        response = self.client.post('/setting/backup/', data, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Setting.objects.get(user=self.user).display_mode, 1)
+
+    def test_key_in_progress_or_used_elsewhere(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}',
+            'HTTP_IDEMPOTENCY_KEY': 'favorites-1',
+        }
+        IdempotencyKey.objects.create(user=self.user, key='favorites-1', path='/symbol/favorite/backup/',
+                                      created_at=timezone.now())
+        response = self.client.post('/symbol/favorite/backup/', {'id': []}, content_type='application/json',
+                                    **headers)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = self.client.post('/setting/backup/', {}, **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Idempotency-Key', response.json()['error']['message'])
+
+    def test_abandoned_key_is_taken_over(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}',
+            'HTTP_IDEMPOTENCY_KEY': 'favorites-1',
+        }
+        IdempotencyKey.objects.create(user=self.user, key='favorites-1', path='/symbol/favorite/backup/',
+                                      created_at=timezone.now() - datetime.timedelta(hours=1))
+        response = self.client.post('/symbol/favorite/backup/', {'id': []}, content_type='application/json',
+                                    **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(IdempotencyKey.objects.get(user=self.user).status_code, 200)
+
+    def test_purge_expired_keys(self):
+        now = timezone.now()
+        IdempotencyKey.objects.create(user=self.user, key='old', path='/setting/backup/', status_code=200,
+                                      created_at=now - datetime.timedelta(days=2))
+        IdempotencyKey.objects.create(user=self.user, key='new', path='/setting/backup/', status_code=200,
+                                      created_at=now)
+
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('idempotency_keys_deleted=1', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+
+class TombstonePurgeTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test_email@gmail.com',
+            password='test_password',
+            nickname='test_nickname'
+        )
+        self.tokens = self.login_and_get_tokens()
+        self.access_token = self.tokens.get('access')
+        self.refresh_token = self.tokens.get('refresh')
+
+        Symbol.objects.create(id=1, text="default1", category=1)
+        Symbol.objects.create(id=2, text="default2", category=1)
+        Symbol.objects.create(id=3, text="default3", category=1)
+
+    def login_and_get_tokens(self):
+        data = {
+            'email': 'test_email@gmail.com',
+            'password': 'test_password',
+        }
+        response = self.client.post('/user/login/', data)
+        if response.status_code == status.HTTP_200_OK:
+            tokens = response.json()
+            return tokens
+        return None
+
+    def test_purge_expires_older_cursors(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.post('/symbol/favorite/backup/?id=1', **headers)  # version 1
+        self.client.post('/symbol/favorite/backup/?id=2', **headers)  # version 2, 1 removed
+        Tombstone.objects.update(created_at=timezone.now() - datetime.timedelta(days=60))
+        self.client.post('/symbol/favorite/backup/?id=3', **headers)  # version 3, 2 removed
+
+        out = StringIO()
+        call_command('purge_tombstones', stdout=out)
+        self.assertIn('tombstones_deleted=1', out.getvalue())
+        self.assertEqual(list(Tombstone.objects.values_list('object_id', flat=True)), [2])
+
+        # the removal of 1 can no longer be reported
+        response = self.client.get('/symbol/favorite/backup/?since=1', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('since', response.json()['error']['message'])
+
+        response = self.client.get('/symbol/favorite/backup/?since=2', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json().get('deleted'), [2])
+
+
+class ManifestTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test_email@gmail.com',
+            password='test_password',
+            nickname='test_nickname'
+        )
+        self.tokens = self.login_and_get_tokens()
+        self.access_token = self.tokens.get('access')
+        self.refresh_token = self.tokens.get('refresh')
+
+        Symbol.objects.create(id=1, text="default1", category=1)
+        Symbol.objects.create(id=2, text="default2", category=1)
+        Symbol.objects.create(id=501, text="test1", category=1, created_by=self.user)
+        Symbol.objects.create(id=502, text="test2", category=2, created_by=self.user)
+
+    def login_and_get_tokens(self):
+        data = {
+            'email': 'test_email@gmail.com',
+            'password': 'test_password',
+        }
+        response = self.client.post('/user/login/', data)
+        if response.status_code == status.HTTP_200_OK:
+            tokens = response.json()
+            return tokens
+        return None
+
+    def get_manifest(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        response = self.client.get('/backup/manifest/', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_get_manifest_success(self):
+        manifest = self.get_manifest()
+        self.assertEqual(list(manifest), ['settings', 'favorites', 'symbols', 'weights'])
+        self.assertEqual(manifest['favorites'], {'hash': '0' * 32, 'count': 0, 'cursor': 0})
+        self.assertEqual(manifest['weights']['count'], len(load_default_weights()))
+
+    def test_manifest_follows_writes(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.get_manifest()
+
+        self.client.post('/symbol/enable/?id=501,502', **headers)
+        self.client.post('/symbol/favorite/backup/?id=1,502', **headers)
+        self.client.post('/symbol/favorite/backup/?id=1,501,502', **headers)
+        self.client.post('/symbol/enable/?id=501', **headers)  # drops 502 and its favorite
+        self.client.post('/setting/backup/', {'display_mode': 1, 'default_menu': 0, 'auto_backup': 1}, **headers)
+        data = {'weight_table': [{'id': 1, 'weight': '[0,10,0]'}]}
+        self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+        data = {'increments': [{'from_symbol': 2, 'to_symbol': 1, 'delta': 5}]}
+        self.client.post('/weight/increment/', data, content_type='application/json', **headers)
+
+        # kept up to date by the writes, not computed on read
+        versions = dict(SectionManifest.objects.filter(user=self.user).values_list('section', 'version'))
+        self.assertEqual(versions, {'settings': 1, 'favorites': 3, 'symbols': 2, 'weights': 2})
+        manifest = self.get_manifest()
+
+        expected = sum(map(row_hash, ['1', '501'])) % HASH_MODULUS
+        self.assertEqual(manifest['favorites'], {'hash': '{:032x}'.format(expected), 'count': 2, 'cursor': 3})
+        self.assertEqual(manifest['symbols']['count'], 1)
+        self.assertEqual(manifest['settings']['count'], 1)
+
+        # same as computing every section from its rows
+        SectionManifest.objects.filter(user=self.user).delete()
+        self.assertEqual(self.get_manifest(), manifest)
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+
+app_name = 'backup'
+urlpatterns = [
+    path('bundle/', views.BundleView.as_view(), name='backup bundle'),
+    path('manifest/', views.ManifestView.as_view(), name='get backup manifest'),
+]
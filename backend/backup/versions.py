@@ -0,0 +1,39 @@
+from backup.locking import lock_wait
+from backup.models import SectionVersion
+from weight_table.models import WeightTableVersion
+
+FAVORITES = 'favorites'
+SYMBOLS = 'symbols'
+SETTINGS = 'settings'
+WEIGHTS = 'weights'
+SECTIONS = (SETTINGS, FAVORITES, SYMBOLS, WEIGHTS)
+
+
+# Must be called inside the transaction of the write; concurrent writers of the same section wait here
+def lock_section_version(user, section):
+    with lock_wait(section):
+        version, _ = SectionVersion.objects.select_for_update().get_or_create(user=user, section=section)
+    return version
+
+
+def bump_section_version(user, section):
+    version = lock_section_version(user, section)
+    version.version += 1
+    version.save()
+    return version.version
+
+
+def get_section_version(user, section):
+    if section == WEIGHTS:
+        versions = WeightTableVersion.objects.filter(user=user)
+    else:
+        versions = SectionVersion.objects.filter(user=user, section=section)
+    return versions.values_list('version', flat=True).first() or 0
+
+
+def section_etag(section):
+    # etag_func for django.views.decorators.http.condition: a restore check
+    # that matches costs one indexed lookup instead of loading the section
+    def etag(request, *args, **kwargs):
+        return '{}-{}-{}'.format(section, request.user.id, get_section_version(request.user, section))
+    return etag
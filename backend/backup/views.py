@@ -0,0 +1,131 @@
+import json
+
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework import permissions, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
+
+from backup.idempotency import idempotent
+from backup.locking import atomic_with_retry
+from backup.manifest import get_manifest
+from backup.versions import FAVORITES, SECTIONS, SETTINGS, SYMBOLS, WEIGHTS, get_section_version
+from entry.views import backup_favorites, check_symbol_ids, enable_my_symbols, get_favorites, get_my_symbols
+from setup.views import backup_settings, get_settings
+from weight_table.streaming import stream_weight_table
+from weight_table.views import backup_weight_table, get_weight_table
+
+# Name of the bundle write in the lock metrics (backup_lock_stats)
+BUNDLE = 'bundle'
+
+# Each section of a bundle holds what the section's own endpoint returns (GET)
+# or takes (POST): settings -> /setting/backup/, favorites -> /symbol/favorite/backup/,
+# symbols -> /symbol/ and /symbol/enable/ ({"id": [...]}), weights -> /weight/backup/
+READERS = {
+    SETTINGS: get_settings,
+    FAVORITES: get_favorites,
+    SYMBOLS: get_my_symbols,
+    WEIGHTS: get_weight_table,
+}
+
+# Applied in this order: enabling symbols can drop favorites, and it locks
+# the symbols section before the favorites one, as MySymbolEnableView does
+WRITERS = {
+    SYMBOLS: lambda user, data: enable_my_symbols(user, check_symbol_ids(data.get('id', []))),
+    FAVORITES: lambda user, data: backup_favorites(user, check_symbol_ids(data.get('id', []))),
+    WEIGHTS: lambda user, data: backup_weight_table(user, data.get('weight_table')),
+    SETTINGS: backup_settings,
+}
+
+
+def requested_sections(request):
+    query = request.query_params.get('sections')
+    if not query:
+        return list(READERS)
+
+    names = query.split(',')
+    unknown = [name for name in names if name not in READERS]
+    if unknown:
+        raise ValidationError({"sections": ["Unknown section: {}".format(', '.join(unknown))]})
+    return [name for name in READERS if name in names]
+
+
+def bundle_etag(request, *args, **kwargs):
+    try:
+        names = requested_sections(request)
+    except ValidationError:
+        return None  # reported by the view
+    versions = ['{}.{}'.format(name, get_section_version(request.user, name)) for name in names]
+    return 'bundle-{}-{}'.format(request.user.id, '-'.join(versions))
+
+
+def stream_bundle(user, names):
+    # One section is loaded and encoded at a time; the weight table row by row
+    yield '{'
+    for i, name in enumerate(names):
+        yield '{}{}:'.format(',' if i else '', json.dumps(name))
+        if name == WEIGHTS:
+            yield from stream_weight_table(user)
+        else:
+            yield json.dumps(READERS[name](user), cls=JSONEncoder, ensure_ascii=False)
+    yield '}'
+
+
+# The whole account in one round trip
+class BundleView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    @method_decorator(condition(etag_func=bundle_etag))
+    def get(self, request):
+        names = requested_sections(request)
+        return StreamingHttpResponse(stream_bundle(request.user, names), content_type='application/json')
+
+    @idempotent
+    def post(self, request):
+        user = request.user
+        bundle = request.data
+
+        if not isinstance(bundle, dict):
+            raise ValidationError({"bundle": ["Expected an object of sections"]})
+        unknown = [name for name in bundle if name not in WRITERS]
+        if unknown:
+            raise ValidationError({"sections": ["Unknown section: {}".format(', '.join(unknown))]})
+
+        # All or nothing: a section failing validation rolls back the ones before it
+        def write_sections():
+            for name, write in WRITERS.items():
+                if name not in bundle:
+                    continue
+                data = bundle[name]
+                if not isinstance(data, dict):
+                    raise ValidationError({name: ["Expected an object"]})
+                try:
+                    write(user, data)
+                except ValidationError as e:
+                    raise ValidationError({name: e.detail})
+
+        atomic_with_retry(BUNDLE, write_sections)
+
+        response_data = {
+            "cursors": {name: get_section_version(user, name) for name in WRITERS if name in bundle}
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+def manifest_etag(request, *args, **kwargs):
+    versions = ['{}.{}'.format(name, get_section_version(request.user, name)) for name in SECTIONS]
+    return 'manifest-{}-{}'.format(request.user.id, '-'.join(versions))
+
+
+# Hash and row count of every section (see backup.manifest), so a client can
+# back up only the sections whose local copy differs
+class ManifestView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    @method_decorator(condition(etag_func=manifest_etag))
+    def get(self, request):
+        response_data = get_manifest(request.user)
+        return Response(response_data, status=status.HTTP_200_OK)
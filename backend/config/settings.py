@@ -74,6 +74,26 @@ AWS_S3_OBJECT_PARAMETERS = {
     'CacheControl': 'max-age=86400',
 }
 
+# collect_storage_garbage: give up on an image after this many failed deletes,
+# and remove symbols that were uploaded but never enabled after SYMBOL_ORPHAN_AGE
+STORAGE_GC_MAX_ATTEMPTS = 5
+SYMBOL_ORPHAN_AGE = datetime.timedelta(days=7)
+
+# Symbol image ingest (entry.images): uploads above the pixel budget are rejected
+# before decoding, the stored image is bounded to SYMBOL_IMAGE_MAX_SIDE and
+# square thumbnails of each variant size are generated for the symbol tiles
+SYMBOL_IMAGE_MAX_PIXELS = 40_000_000
+SYMBOL_IMAGE_MAX_SIDE = 1024
+SYMBOL_IMAGE_VARIANT_SIZES = (128, 256)
+
+# Direct-to-storage symbol uploads (entry.direct_upload): the client sends the
+# file to a presigned URL and the server only checks and records it afterwards
+SYMBOL_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+SYMBOL_UPLOAD_EXPIRES = 600  # seconds
+# A confirm that died while checking the file no longer holds its upload after this
+SYMBOL_UPLOAD_CONFIRM_TIMEOUT = 60  # seconds
+SYMBOL_UPLOAD_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif')
+
 # Static Setting
 STATICFILES_STORAGE = "config.s3storages.StaticStorage"  # 저장 루트 관련
 STATIC_URL = "https://%s/static/" % AWS_S3_CUSTOM_DOMAIN  # 저장 루트와 관련 X, 불러오는 루트
@@ -114,7 +134,8 @@ INSTALLED_APPS = [
     'entry',
     'setup',
     'storages',
-    'weight_table'
+    'weight_table',
+    'backup'
 ]
 
 MIDDLEWARE = [
@@ -201,6 +222,64 @@ USE_TZ = True
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Default weight table shared by every user (one row per default symbol)
+WEIGHT_TABLE_PATH = os.path.join(BASE_DIR, 'weight_table.txt')
+# Binary copy of the table above, built by `python manage.py compile_weight_table`
+# and memory-mapped by every worker
+WEIGHT_TABLE_ARTIFACT_PATH = os.path.join(BASE_DIR, 'weight_table.bin')
+# Number of users whose decoded weight matrix is kept per worker for /weight/predict/
+WEIGHT_MATRIX_CACHE_SIZE = 128
+# Rows per chunk of a streamed weight table (GET /weight/backup/?stream=1)
+WEIGHT_STREAM_CHUNK_SIZE = 50
+# Chunked weight table uploads (/weight/upload/): sessions not committed within
+# this time are dropped, and a session takes this many chunks at most
+WEIGHT_UPLOAD_EXPIRES = 24 * 60 * 60  # seconds
+WEIGHT_UPLOAD_MAX_CHUNKS = 1000
+
+# Cached section payloads for restores (backup.cache). With REDIS_URL set the
+# cache is shared by every worker; run Redis with maxmemory-policy allkeys-lru
+# so the least recently restored users are evicted first. Without it each
+# process keeps its own small LRU, for tests and development only: production
+# must set REDIS_URL. A weights payload is ~600 KB, so the per-process cache
+# leaves that section out (BACKUP_CACHE_SECTIONS) and holds few entries.
+BACKUP_CACHE_TIMEOUT = 60 * 60  # seconds
+# A worker building a missing entry holds a lock in the cache this long at most,
+# so concurrent restores in other processes wait for it instead of querying too
+# (0 turns the lock off; identical reads in one process are always coalesced)
+BACKUP_CACHE_LOCK_TIMEOUT = 10  # seconds
+# Tries of a backup write aborted by a deadlock or lock wait timeout (backup.locking)
+BACKUP_WRITE_ATTEMPTS = 3
+# Tombstones of deleted rows are kept this long for delta syncs (purge_tombstones);
+# a client whose cursor is older restores the section in full
+TOMBSTONE_RETENTION = 30 * 24 * 60 * 60  # seconds
+# Outcomes of POSTs sent with an Idempotency-Key are replayed to retries this long
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # seconds
+# after which a request that never recorded its outcome no longer holds its key
+IDEMPOTENCY_KEY_PENDING_TIMEOUT = 5 * 60  # seconds
+if os.environ.get('REDIS_URL'):
+    BACKUP_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+        'KEY_PREFIX': 'backup',
+        'TIMEOUT': BACKUP_CACHE_TIMEOUT,
+    }
+    BACKUP_CACHE_SECTIONS = ('settings', 'favorites', 'symbols', 'weights')
+else:
+    BACKUP_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'backup',
+        'TIMEOUT': BACKUP_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': 300},
+    }
+    BACKUP_CACHE_SECTIONS = ('settings', 'favorites', 'symbols')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'backup': BACKUP_CACHE,
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -6,5 +6,6 @@ urlpatterns = [
     path('user/', include('user.urls')),
     path('setting/', include('setup.urls', namespace='default')),
     path('symbol/', include('entry.urls')),
-    path('weight/', include('weight_table.urls'))
+    path('weight/', include('weight_table.urls')),
+    path('backup/', include('backup.urls'))
 ]
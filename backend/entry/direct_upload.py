@@ -0,0 +1,74 @@
+import datetime
+from uuid import uuid4
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils import timezone
+
+from entry.models import Symbol
+
+# Two-phase symbol upload: SymbolUploadView hands out a presigned POST and the
+# client sends the file to storage itself, then SymbolUploadConfirmView checks
+# the stored object and creates the Symbol. The request workers never carry the
+# upload from a slow mobile connection.
+SIGNING_SALT = 'entry.direct_upload'
+
+
+def symbol_storage():
+    return Symbol._meta.get_field('image').storage
+
+
+def upload_key(user):
+    return 'upload/user_{}/{}'.format(user.id, uuid4().hex)
+
+
+def is_expired(upload):
+    return upload.created_at < timezone.now() - datetime.timedelta(seconds=settings.SYMBOL_UPLOAD_EXPIRES)
+
+
+def is_being_confirmed(upload):
+    started = upload.confirm_started_at
+    return started is not None and \
+        started >= timezone.now() - datetime.timedelta(seconds=settings.SYMBOL_UPLOAD_CONFIRM_TIMEOUT)
+
+
+def upload_target(storage, upload, request):
+    # returns (url, fields); the client POSTs the fields plus `file` as multipart/form-data
+    max_bytes = settings.SYMBOL_UPLOAD_MAX_BYTES
+    expires = settings.SYMBOL_UPLOAD_EXPIRES
+
+    bucket = getattr(storage, 'bucket', None)
+    if bucket is not None:
+        # S3 enforces the size range and content type itself
+        post = bucket.meta.client.generate_presigned_post(
+            Bucket=bucket.name,
+            Key=storage._normalize_name(upload.key),
+            Fields={'Content-Type': upload.content_type},
+            Conditions=[
+                {'Content-Type': upload.content_type},
+                ['content-length-range', 1, max_bytes],
+            ],
+            ExpiresIn=expires,
+        )
+        return post['url'], post['fields']
+
+    # Local storage stand-in (FileSystemStorage in tests and development):
+    # LocalUploadView accepts the same form, authorized by a signed token
+    token = signing.dumps({'key': upload.key, 'content_type': upload.content_type}, salt=SIGNING_SALT)
+    fields = {'key': upload.key, 'Content-Type': upload.content_type, 'token': token}
+    return request.build_absolute_uri(reverse('entry:upload symbol image locally')), fields
+
+
+def check_local_upload(fields, file):
+    # returns the storage key the form is allowed to write to, or raises ValueError
+    try:
+        signed = signing.loads(fields.get('token', ''), salt=SIGNING_SALT, max_age=settings.SYMBOL_UPLOAD_EXPIRES)
+    except signing.BadSignature:
+        raise ValueError('invalid or expired upload token')
+
+    if fields.get('key') != signed['key'] or fields.get('Content-Type') != signed['content_type']:
+        raise ValueError('fields do not match the upload token')
+    if not 1 <= file.size <= settings.SYMBOL_UPLOAD_MAX_BYTES:
+        raise ValueError('file size out of range')
+    return signed['key']
@@ -0,0 +1,114 @@
+import hashlib
+import os
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from entry.models import PendingImageDeletion, StoredImage, Symbol, SymbolImageVariant
+
+
+# Images are stored under a key derived from the sha256 of the uploaded bytes,
+# so the same picture uploaded again (or restored on a new device) is neither
+# decoded nor sent to storage a second time; StoredImage counts the symbols using it.
+
+def image_digest(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class UploadedSymbolImage:
+    # Validated image of MySymbolBackupSerializer; `image` (the output of
+    # ingest_symbol_image) is None when the server already has these bytes
+    def __init__(self, digest, image=None):
+        self.digest = digest
+        self.image = image
+
+
+def _upload(digest, image):
+    storage = Symbol._meta.get_field('image').storage
+    prefix = 'symbol/{}/{}'.format(digest[:2], digest)
+
+    extension = os.path.splitext(image.original.name)[1]
+    name = storage.save(prefix + extension, image.original)
+    variants = {}
+    for size, variant in image.variants.items():
+        extension = os.path.splitext(variant.name)[1]
+        variants[str(size)] = storage.save('{}_{}{}'.format(prefix, size, extension), variant)
+    return name, variants
+
+
+def user_has_image(user, digest):
+    # Whether one of the user's own symbols uses these bytes; other accounts'
+    # images are not revealed (nor reused without the upload) by their digest
+    names = StoredImage.objects.filter(digest=digest).values('name')
+    return Symbol.objects.filter(created_by=user, image__in=names).exists()
+
+
+def upload_image(image):
+    # Puts the bytes of an image the server does not store yet into storage,
+    # outside any transaction; returns (name, variants) for acquire_image, or
+    # None when there is nothing to upload
+    if image.image is None or StoredImage.objects.filter(digest=image.digest).exists():
+        return None
+    return _upload(image.digest, image.image)
+
+
+def uploaded_names(uploaded):
+    name, variants = uploaded
+    return [name] + list(variants.values())
+
+
+def acquire_image(image, uploaded=None):
+    # In the caller's (short) transaction: returns the StoredImage for the upload
+    # with one more reference taken, recording the files of upload_image when
+    # the digest is new. The caller queues those files for deletion if its
+    # transaction does not commit.
+    if StoredImage.objects.filter(digest=image.digest).update(refcount=F('refcount') + 1):
+        if uploaded is not None:
+            # A concurrent request stored the same bytes first; use that copy instead
+            PendingImageDeletion.objects.enqueue(uploaded_names(uploaded))
+        return StoredImage.objects.get(digest=image.digest)
+
+    if uploaded is None:
+        raise ValueError('unknown image digest')
+
+    name, variants = uploaded
+    try:
+        with transaction.atomic():
+            return StoredImage.objects.create(digest=image.digest, name=name, variants=variants, refcount=1)
+    except IntegrityError:
+        PendingImageDeletion.objects.enqueue(uploaded_names(uploaded))
+        StoredImage.objects.filter(digest=image.digest).update(refcount=F('refcount') + 1)
+        return StoredImage.objects.get(digest=image.digest)
+
+
+def release_symbol_images(symbols):
+    # Drop the references held by the given Symbol queryset (call before deleting
+    # it); files whose last reference goes away are queued for deletion
+    counts = Counter(name for name in symbols.values_list('image', flat=True) if name)
+
+    with transaction.atomic():
+        stored = list(StoredImage.objects.select_for_update().filter(name__in=counts))
+        stored_names = {item.name for item in stored}
+
+        # Images uploaded before content addressing belong to a single symbol
+        legacy = [name for name in counts if name not in stored_names]
+        to_delete = legacy + list(
+            SymbolImageVariant.objects.filter(symbol__in=symbols, symbol__image__in=legacy)
+            .values_list('image', flat=True)
+        )
+
+        released = []
+        for item in stored:
+            item.refcount -= counts[item.name]
+            if item.refcount <= 0:
+                released.append(item.id)
+                to_delete += [item.name] + list(item.variants.values())
+        StoredImage.objects.filter(id__in=released).delete()
+        StoredImage.objects.bulk_update([item for item in stored if item.id not in released], ['refcount'])
+
+        return PendingImageDeletion.objects.enqueue(to_delete)
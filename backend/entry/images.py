@@ -0,0 +1,69 @@
+import os
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+# Variants are WebP when this Pillow build can write it, PNG otherwise
+VARIANT_FORMAT, VARIANT_EXTENSION = ('WEBP', '.webp') if features.check('webp') else ('PNG', '.png')
+
+
+class SymbolImage:
+    # Result of ingest_symbol_image: the cleaned image stored as Symbol.image
+    # and {size: file} thumbnails stored as SymbolImageVariant rows
+    def __init__(self, original, variants):
+        self.original = original
+        self.variants = variants
+
+
+def _encode(image, format, **params):
+    buffer = BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+def ingest_symbol_image(file):
+    max_side = settings.SYMBOL_IMAGE_MAX_SIDE
+
+    # Image.open only parses the header, so the pixel budget is checked before
+    # anything is decoded; Pillow's own bomb check is turned into an error too
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(file)
+            width, height = image.size
+            if width * height > settings.SYMBOL_IMAGE_MAX_PIXELS:
+                raise ValueError('image is too large ({}x{})'.format(width, height))
+
+            # JPEG can be decoded straight at a reduced scale (phone photos)
+            if image.format == 'JPEG':
+                image.draft('RGB', (max_side, max_side))
+            source_format = image.format
+            image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, Image.DecompressionBombWarning, OSError) as e:
+        raise ValueError('invalid image ({})'.format(e))
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    image.thumbnail((max_side, max_side))
+    # Drop EXIF, ICC and text chunks so none of them is written back out
+    image.info = {}
+
+    stem = os.path.splitext(os.path.basename(file.name or 'symbol'))[0]
+    if source_format == 'JPEG' and image.mode == 'RGB':
+        original = ContentFile(_encode(image, 'JPEG', quality=90), name=stem + '.jpg')
+    else:
+        original = ContentFile(_encode(image, 'PNG', optimize=True), name=stem + '.png')
+
+    variants = {}
+    for size in settings.SYMBOL_IMAGE_VARIANT_SIZES:
+        variant = image.copy()
+        variant.thumbnail((size, size))
+        data = _encode(variant, VARIANT_FORMAT, quality=80) if VARIANT_FORMAT == 'WEBP' \
+            else _encode(variant, VARIANT_FORMAT, optimize=True)
+        variants[size] = ContentFile(data, name='{}_{}{}'.format(stem, size, VARIANT_EXTENSION))
+
+    return SymbolImage(original, variants)
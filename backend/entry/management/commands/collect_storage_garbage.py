@@ -0,0 +1,30 @@
+import datetime
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from entry.storage_gc import MAX_BATCH_SIZE, collect_expired_uploads, collect_orphan_symbols, delete_pending_images
+
+
+# Meant to run periodically (e.g. from cron): python manage.py collect_storage_garbage
+class Command(BaseCommand):
+    help = 'Delete queued symbol images from media storage and drop symbols that were never enabled or uploads never confirmed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orphan-age-days', type=int, default=settings.SYMBOL_ORPHAN_AGE.days,
+                            help='Remove never-enabled symbols older than this')
+        parser.add_argument('--batch-size', type=int, default=MAX_BATCH_SIZE)
+        parser.add_argument('--retries', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if options['retries'] < 1:
+            raise CommandError('--retries must be at least 1')
+        orphans = collect_orphan_symbols(datetime.timedelta(days=options['orphan_age_days']))
+        uploads = collect_expired_uploads(datetime.timedelta(seconds=settings.SYMBOL_UPLOAD_EXPIRES))
+        stats = delete_pending_images(default_storage, batch_size=options['batch_size'], retries=options['retries'])
+
+        self.stdout.write(
+            'orphan_symbols={} expired_uploads={} images_deleted={} images_failed={} batches={}'.format(
+                orphans, uploads, stats['deleted'], stats['failed'], stats['batches'])
+        )
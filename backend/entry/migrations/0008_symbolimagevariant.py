@@ -0,0 +1,24 @@
+# Generated by Django 4.2.5 on 2026-10-18 09:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+import entry.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entry', '0007_pendingimagedeletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SymbolImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.IntegerField()),
+                ('image', models.ImageField(upload_to=entry.models.variant_upload_func)),
+                ('symbol', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='entry.symbol')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.5 on 2026-10-18 09:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('entry', '0009_storedimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SymbolUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('text', models.CharField(max_length=20)),
+                ('category', models.IntegerField()),
+                ('content_type', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='symbol_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.5 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entry', '0010_symbolupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favoritesymbol',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='symbol',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
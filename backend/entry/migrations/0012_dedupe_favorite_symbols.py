@@ -0,0 +1,38 @@
+# Generated by Django 4.2.5 on 2026-10-18 15:00
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+BATCH_SIZE = 500
+
+
+# The same symbol could be favorited twice by concurrent backups; keep the
+# oldest row so the unique constraint in 0013 can be added
+def dedupe_favorite_symbols(apps, schema_editor):
+    FavoriteSymbol = apps.get_model('entry', 'FavoriteSymbol')
+    duplicates = list(
+        FavoriteSymbol.objects.values('user_id', 'symbol_id')
+        .annotate(rows=Count('id'), keep=Min('id'))
+        .filter(rows__gt=1)
+        .values_list('user_id', 'symbol_id', 'keep')
+    )
+    for start in range(0, len(duplicates), BATCH_SIZE):
+        to_delete = []
+        for user_id, symbol_id, keep in duplicates[start:start + BATCH_SIZE]:
+            to_delete.extend(
+                FavoriteSymbol.objects.filter(user_id=user_id, symbol_id=symbol_id)
+                .exclude(id=keep)
+                .values_list('id', flat=True)
+            )
+        FavoriteSymbol.objects.filter(id__in=to_delete).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entry', '0011_favoritesymbol_version_symbol_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_favorite_symbols, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entry', '0012_dedupe_favorite_symbols'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='symbol',
+            index=models.Index(fields=['created_by', 'is_valid'], name='symbol_created_by_valid'),
+        ),
+        migrations.AddConstraint(
+            model_name='favoritesymbol',
+            constraint=models.UniqueConstraint(fields=('user', 'symbol'), name='unique_favorite_per_user'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entry', '0013_favorite_unique_symbol_owner_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='symbolupload',
+            name='confirm_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
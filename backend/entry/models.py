@@ -18,6 +18,10 @@ def img_upload_func(instance, filename):
     )
 
 
+def variant_upload_func(instance, filename):
+    return img_upload_func(instance.symbol, filename)
+
+
 class Symbol(models.Model):
     text = models.CharField(max_length=20, null=False, blank=False)
     category = models.IntegerField(null=False, blank=False)
@@ -25,9 +29,71 @@ class Symbol(models.Model):
     created_by = models.ForeignKey('user.User', related_name='symbols', on_delete=models.CASCADE, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     is_valid = models.BooleanField(default=False)
+    version = models.BigIntegerField(default=0)  # section version of the last change (see backup.sync)
+
+    class Meta:
+        indexes = [
+            # a user's enabled symbols (get_my_symbols, enable_my_symbols)
+            models.Index(fields=['created_by', 'is_valid'], name='symbol_created_by_valid'),
+        ]
+
+
+# Fixed-size thumbnail of a symbol image (see entry.images)
+class SymbolImageVariant(models.Model):
+    symbol = models.ForeignKey('Symbol', related_name='variants', on_delete=models.CASCADE)
+    size = models.IntegerField(null=False, blank=False)
+    image = models.ImageField(upload_to=variant_upload_func)
 
 
 class FavoriteSymbol(models.Model):
     symbol = models.ForeignKey('Symbol', related_name='favorites', on_delete=models.CASCADE)
     user = models.ForeignKey('user.User', related_name='favorites', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    version = models.BigIntegerField(default=0)  # section version of the last change (see backup.sync)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'symbol'], name='unique_favorite_per_user'),
+        ]
+
+
+class PendingImageDeletionManager(models.Manager):
+
+    def enqueue(self, names):
+        names = [str(name) for name in names if name]
+        self.bulk_create([self.model(name=name) for name in names])
+        return len(names)
+
+
+# Image waiting to be removed from storage by the collect_storage_garbage command,
+# so request handlers never talk to S3 themselves
+class PendingImageDeletion(models.Model):
+    objects = PendingImageDeletionManager()
+
+    name = models.CharField(max_length=255)  # storage name, as in Symbol.image
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+# One stored copy of an uploaded image, shared by every symbol created from the
+# same bytes (see entry.image_store). The files are deleted with the last reference.
+class StoredImage(models.Model):
+    digest = models.CharField(max_length=64, unique=True)  # sha256 of the uploaded bytes
+    name = models.CharField(max_length=255, db_index=True)  # storage name, as in Symbol.image
+    variants = models.JSONField(default=dict)  # {size: storage name}, as in SymbolImageVariant.image
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+# Symbol waiting for its image to be uploaded straight to storage (see
+# entry.direct_upload). Becomes a Symbol on confirm; unconfirmed ones expire.
+class SymbolUpload(models.Model):
+    user = models.ForeignKey('user.User', related_name='symbol_uploads', on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)  # storage name the client uploads to
+    text = models.CharField(max_length=20)
+    category = models.IntegerField()
+    content_type = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # set while a confirm request is checking the file (SymbolUploadConfirmView)
+    confirm_started_at = models.DateTimeField(null=True, blank=True)
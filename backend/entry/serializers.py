@@ -1,57 +1,118 @@
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from entry.models import FavoriteSymbol, Symbol
+from entry.direct_upload import upload_key
+from entry.images import ingest_symbol_image
+from entry.image_store import UploadedSymbolImage, acquire_image, image_digest, upload_image, uploaded_names, \
+    user_has_image
+from entry.models import PendingImageDeletion, Symbol, SymbolImageVariant, SymbolUpload
+from entry.upload_handlers import StreamedUpload
 
 
-class FavoriteBackupSerializer(serializers.Serializer):
-    # symbol_id
-    id = serializers.IntegerField(source='symbol_id', required=True)
+# With many=True, looks up every requested symbol id (and its owner) in one query
+# before the items are validated, instead of one or two queries per item
+class SymbolListSerializer(serializers.ListSerializer):
 
-    def validate(self, data):
-        id = data.get('symbol_id')
+    def to_internal_value(self, data):
+        # Parsed as the child's IntegerField does, so e.g. "1.0" is looked up as 1
+        id_field = serializers.IntegerField()
+        ids = set()
+        if isinstance(data, list):
+            for item in data:
+                try:
+                    ids.add(id_field.to_internal_value(item.get('id')))
+                except (AttributeError, ValidationError):
+                    pass  # reported by the child's own field validation
+        self.symbol_owners = dict(Symbol.objects.filter(id__in=ids).values_list('id', 'created_by_id'))
+        return super().to_internal_value(data)
+
+
+class SymbolValidationMixin:
+
+    def validate_symbol(self, id, allow_default=True):
         user = self.context['user']
 
-        all_symbols = list(Symbol.objects.values_list('id', flat=True))
-        if id not in all_symbols:
+        symbol_owners = getattr(self.parent, 'symbol_owners', None)
+        if symbol_owners is None:
+            symbol_owners = dict(Symbol.objects.filter(id=id).values_list('id', 'created_by_id'))
+
+        if id not in symbol_owners:
             raise ValidationError({"id": ["Invalid symbol (no such symbol)"]})
 
+        if id <= 500:
+            if not allow_default:
+                raise ValidationError({"id": ["Default symbol"]})
         # Default symbol이 아니라면
-        if id > 500:
-            symbol = Symbol.objects.get(id=id)
-            if symbol.created_by != user:
-                raise ValidationError({"not_mine": ["the requested symbol is created by another user"]})
+        elif symbol_owners[id] != user.id:
+            raise ValidationError({"not_mine": ["the requested symbol is created by another user"]})
+
+
+class FavoriteBackupSerializer(SymbolValidationMixin, serializers.Serializer):
+    # symbol_id
+    id = serializers.IntegerField(source='symbol_id', required=True)
+
+    class Meta:
+        list_serializer_class = SymbolListSerializer
 
+    def validate(self, data):
+        self.validate_symbol(data.get('symbol_id'))
         return data
 
-    def create(self, validated_data):
-        user = self.context['user']
-        symbol_id = validated_data.get('symbol_id')
-        symbol = Symbol.objects.get(id=symbol_id)
 
-        # if the symbol is not registered as favorite
-        if not FavoriteSymbol.objects.filter(user=user, symbol=symbol).exists():
-            FavoriteSymbol.objects.create(user=user, symbol=symbol)
+# Runs the upload through entry.images instead of letting ImageField decode it
+# in full. Bytes the user already stored (same sha256) are not decoded again.
+class SymbolImageField(serializers.FileField):
+
+    def to_internal_value(self, data):
+        file = super().to_internal_value(data)
+        # A StreamedUpload was hashed while the request body was read
+        digest = file.digest if isinstance(file, StreamedUpload) else image_digest(file)
+        if user_has_image(self.context['user'], digest):
+            return UploadedSymbolImage(digest)
 
+        try:
+            with file.open():
+                return UploadedSymbolImage(digest, ingest_symbol_image(file))
+        except ValueError:
+            raise ValidationError(["Upload a valid image (unsupported format, broken or too large)"])
+
+
+class SymbolInfoValidationMixin:
+
+    def validate_text_and_category(self, text, category):
+        # To send custom error message
+        if len(text) > 20:
+            raise ValidationError({"long_text": ["word text is too long"]})
 
-class MySymbolBackupSerializer(serializers.Serializer):
+        if not (1 <= category <= 24):
+            raise ValidationError({"category": ["No such category"]})
+
+
+class MySymbolBackupSerializer(SymbolInfoValidationMixin, serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
     text = serializers.CharField(required=True)
     category = serializers.IntegerField(required=True)
-    image = serializers.ImageField(required=True)
+    image = SymbolImageField(required=False)
+    # sha256 of the image file; enough on its own for an image of one of the user's symbols
+    image_sha256 = serializers.CharField(required=False, write_only=True, max_length=64)
+    variants = serializers.SerializerMethodField()
     created_at = serializers.DateTimeField(read_only=True)
 
     def validate(self, data):
         text = data.get('text')
         category = data.get('category')
 
-        # To send custom error message
-        if len(text) > 20:
-            raise ValidationError({"long_text": ["word text is too long"]})
-
-        if not (1 <= category <= 24):
-            raise ValidationError({"category": ["No such category"]})
+        if 'image' not in data:
+            digest = data.get('image_sha256', '').lower()
+            if not digest:
+                raise ValidationError({"image": ["No file was submitted."]})
+            if not user_has_image(self.context['user'], digest):
+                raise ValidationError({"image": ["Unknown image, upload the file"]})
+            data['image'] = UploadedSymbolImage(digest)
 
+        self.validate_text_and_category(text, category)
         return data
 
     def create(self, validated_data):
@@ -61,28 +122,58 @@ class MySymbolBackupSerializer(serializers.Serializer):
         category = validated_data['category']
         image = validated_data['image']
 
-        symbol = Symbol.objects.create(text=text, category=category, image=image, created_by=user)
+        # Storage is written before the transaction, which only records the files
+        uploaded = upload_image(image)
+        try:
+            with transaction.atomic():
+                try:
+                    stored = acquire_image(image, uploaded)
+                except ValueError:
+                    # released by another request since validation
+                    raise ValidationError({"image": ["Unknown image, upload the file"]})
+
+                symbol = Symbol.objects.create(text=text, category=category, image=stored.name, created_by=user)
+                SymbolImageVariant.objects.bulk_create([
+                    SymbolImageVariant(symbol=symbol, size=int(size), image=name)
+                    for size, name in stored.variants.items()
+                ])
+        except BaseException:
+            if uploaded is not None:
+                PendingImageDeletion.objects.enqueue(uploaded_names(uploaded))
+            raise
 
         return symbol
 
+    def get_variants(self, symbol):
+        # {size: url}; prefetch_related('variants') when serializing many symbols
+        return {str(variant.size): variant.image.url for variant in symbol.variants.all()}
 
-class MySymbolEnableSerializer(serializers.Serializer):
-    id = serializers.IntegerField(required=True)
+
+# First phase of a direct upload (entry.direct_upload): the symbol's text and
+# category are checked now, the image once it is in storage
+class SymbolUploadSerializer(SymbolInfoValidationMixin, serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    text = serializers.CharField(required=True)
+    category = serializers.IntegerField(required=True)
+    content_type = serializers.CharField(required=True)
 
     def validate(self, data):
-        id = data.get('id')
+        self.validate_text_and_category(data.get('text'), data.get('category'))
+        if data.get('content_type') not in settings.SYMBOL_UPLOAD_CONTENT_TYPES:
+            raise ValidationError({"content_type": ["Unsupported image type"]})
+        return data
+
+    def create(self, validated_data):
         user = self.context['user']
+        return SymbolUpload.objects.create(user=user, key=upload_key(user), **validated_data)
 
-        all_symbols = list(Symbol.objects.values_list('id', flat=True))
-        if id not in all_symbols:
-            raise ValidationError({"id": ["Invalid symbol (no such symbol)"]})
 
-        if id <= 500:
-            raise ValidationError({"id": ["Default symbol"]})
+class MySymbolEnableSerializer(SymbolValidationMixin, serializers.Serializer):
+    id = serializers.IntegerField(required=True)
 
-        # Default symbol이 아닌 경우
-        symbol = Symbol.objects.get(id=id)
-        if symbol.created_by != user:
-            raise ValidationError({"not_mine": ["the requested symbol is created by another user"]})
+    class Meta:
+        list_serializer_class = SymbolListSerializer
 
+    def validate(self, data):
+        self.validate_symbol(data.get('id'), allow_default=False)
         return data
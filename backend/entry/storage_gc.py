@@ -0,0 +1,132 @@
+import logging
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from backup.cache import invalidate_section
+from backup.locking import section_write
+from backup.manifest import symbol_row, update_manifest
+from backup.sync import record_tombstones
+from backup.versions import FAVORITES, bump_section_version
+from entry.image_store import release_symbol_images
+from entry.models import FavoriteSymbol, PendingImageDeletion, Symbol, SymbolUpload
+from user.models import User
+
+logger = logging.getLogger(__name__)
+
+# delete_objects accepts at most 1000 keys per call
+MAX_BATCH_SIZE = 1000
+
+
+def _forget_favorites(symbols):
+    # Favorites of the deleted symbols go with them (on_delete=CASCADE); each
+    # owner's favorites section changes as in entry.views.enable_my_symbols
+    lost_favorites = defaultdict(list)
+    for user_id, symbol_id in FavoriteSymbol.objects.filter(symbol__in=symbols).values_list('user_id', 'symbol_id'):
+        lost_favorites[user_id].append(symbol_id)
+
+    for user in User.objects.filter(id__in=lost_favorites).order_by('id'):
+        symbol_ids = lost_favorites[user.id]
+        version = bump_section_version(user, FAVORITES)
+        record_tombstones(user, FAVORITES, symbol_ids, version)
+        update_manifest(user, FAVORITES, version, removed=[symbol_row(symbol_id) for symbol_id in symbol_ids])
+        invalidate_section(user.id, FAVORITES)
+
+
+def collect_orphan_symbols(older_than):
+    # Symbols uploaded through MySymbolBackupView but never enabled by a backup
+    cutoff = timezone.now() - older_than
+    orphans = Symbol.objects.filter(created_by__isnull=False, is_valid=False, created_at__lt=cutoff)
+
+    removed = 0
+    while True:
+        batch = list(orphans.values_list('id', flat=True)[:MAX_BATCH_SIZE])
+        if not batch:
+            return removed
+        with transaction.atomic(), section_write():
+            # Checked again under the row locks: a symbol enabled since the batch
+            # was read is no longer an orphan and stays
+            locked = list(orphans.filter(id__in=batch).select_for_update().values_list('id', flat=True))
+            symbols = Symbol.objects.filter(id__in=locked)
+            _forget_favorites(symbols)
+            release_symbol_images(symbols)
+            symbols.delete()
+        removed += len(locked)
+
+
+def collect_expired_uploads(older_than):
+    # Direct uploads never confirmed; whatever the client put in storage goes too
+    cutoff = timezone.now() - older_than
+    expired = SymbolUpload.objects.filter(created_at__lt=cutoff)
+
+    removed = 0
+    while True:
+        batch = list(expired.values_list('id', 'key')[:MAX_BATCH_SIZE])
+        if not batch:
+            return removed
+        with transaction.atomic():
+            PendingImageDeletion.objects.enqueue([key for _, key in batch])
+            SymbolUpload.objects.filter(id__in=[id for id, _ in batch]).delete()
+        removed += len(batch)
+
+
+def _delete_batch(storage, names):
+    # returns {name: error} for the names that could not be deleted
+    bucket = getattr(storage, 'bucket', None)
+    if bucket is None:
+        # Local storage stand-in (FileSystemStorage in tests and development)
+        for name in names:
+            storage.delete(name)
+        return {}
+
+    keys = {storage._normalize_name(name): name for name in names}
+    response = bucket.meta.client.delete_objects(
+        Bucket=bucket.name,
+        Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True},
+    )
+    return {keys[error['Key']]: error.get('Message', error.get('Code', '')) for error in response.get('Errors', [])}
+
+
+def delete_pending_images(storage, batch_size=MAX_BATCH_SIZE, retries=3, max_attempts=None):
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+    retries = max(retries, 1)  # every batch is tried at least once
+    max_attempts = max_attempts or settings.STORAGE_GC_MAX_ATTEMPTS
+    stats = {'deleted': 0, 'failed': 0, 'batches': 0}
+
+    pending = PendingImageDeletion.objects.filter(attempts__lt=max_attempts).order_by('id')
+    last_id = 0
+    while True:
+        batch = list(pending.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        names = sorted({item.name for item in batch})
+
+        for attempt in range(retries):
+            try:
+                errors = _delete_batch(storage, names)
+                break
+            except Exception as e:
+                logger.warning('Deleting %d images failed (attempt %d/%d): %s', len(names), attempt + 1, retries, e)
+                errors = {name: str(e) for name in names}
+                if attempt + 1 < retries:
+                    time.sleep(0.5 * 2 ** attempt)
+
+        done = [item.id for item in batch if item.name not in errors]
+        PendingImageDeletion.objects.filter(id__in=done).delete()
+        for item in batch:
+            if item.name in errors:
+                item.attempts += 1
+                item.last_error = errors[item.name]
+        PendingImageDeletion.objects.bulk_update([item for item in batch if item.name in errors],
+                                                 ['attempts', 'last_error'])
+
+        stats['batches'] += 1
+        stats['deleted'] += len(done)
+        stats['failed'] += len(batch) - len(done)
+
+    logger.info('Storage GC: %(deleted)d deleted, %(failed)d failed in %(batches)d batches', stats)
+    return stats
@@ -1,8 +1,27 @@
+import datetime
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import StopFutureHandlers
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
 from rest_framework import status
 
-from entry.models import Symbol
+from entry.direct_upload import upload_target
+from entry.images import VARIANT_FORMAT, ingest_symbol_image
+from entry.models import FavoriteSymbol, PendingImageDeletion, StoredImage, Symbol, SymbolUpload
+from entry.serializers import FavoriteBackupSerializer
+from entry.storage_gc import collect_expired_uploads, collect_orphan_symbols, delete_pending_images
+from entry.upload_handlers import StreamingSymbolUploadHandler, _S3MultipartSink
 from user.models import User
 
 
@@ -41,6 +60,28 @@ class SymbolTest(TestCase):
         response = self.client.post('/symbol/favorite/backup/?id=501,502,503', **headers)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_favorite_backup_fail_not_an_object(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        response = self.client.post('/symbol/favorite/backup/', [501, 502], content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_favorite_backup_json_body_success(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        response = self.client.post('/symbol/favorite/backup/', {'id': [501, 502, 503]},
+                                    content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # favorites missing from the new list are removed, the rest are kept
+        response = self.client.post('/symbol/favorite/backup/', {'id': [503, 502, 503]},
+                                    content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        favorites = FavoriteSymbol.objects.filter(user=self.user).values_list('symbol_id', flat=True)
+        self.assertEqual(sorted(favorites), [502, 503])
+
     def test_get_favorite_symbols_success(self):
         headers = {
             'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
@@ -56,6 +97,78 @@ class SymbolTest(TestCase):
         data = response.json()
         self.assertEqual(data.get('results')[0], expected_response)
 
+    def test_get_favorite_symbols_not_modified(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.post('/symbol/favorite/backup/?id=501', **headers)
+        response = self.client.get('/symbol/favorite/backup/', **headers)
+        etag = response['ETag']
+
+        with self.assertNumQueries(2):  # the authenticated user and the section version
+            response = self.client.get('/symbol/favorite/backup/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # a backup changes the tag
+        self.client.post('/symbol/favorite/backup/?id=502', **headers)
+        response = self.client.get('/symbol/favorite/backup/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_get_my_symbols_not_modified(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.post('/symbol/enable/?id=501,502', **headers)
+        etag = self.client.get('/symbol/', **headers)['ETag']
+        response = self.client.get('/symbol/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # enabling again drops the symbols left out
+        self.client.post('/symbol/enable/?id=501', **headers)
+        response = self.client.get('/symbol/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(len(response.json().get('my_symbols')), 1)
+
+    def test_get_favorite_symbols_since_cursor(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.post('/symbol/enable/?id=501,502,503', **headers)
+        self.client.post('/symbol/favorite/backup/', {'id': [501, 502]}, content_type='application/json', **headers)
+        cursor = self.client.get('/symbol/favorite/backup/', **headers).json().get('cursor')
+
+        self.client.post('/symbol/favorite/backup/', {'id': [501, 503]}, content_type='application/json', **headers)
+        response = self.client.get('/symbol/favorite/backup/?since={}'.format(cursor), **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json().get('results'), [{'id': 503}])
+        self.assertEqual(response.json().get('deleted'), [502])
+
+        # deleting a symbol also removes it from the favorites
+        cursor = response.json().get('cursor')
+        self.client.post('/symbol/enable/?id=503', **headers)
+        response = self.client.get('/symbol/favorite/backup/?since={}'.format(cursor), **headers)
+        self.assertEqual(response.json().get('results'), [])
+        self.assertEqual(response.json().get('deleted'), [501])
+
+        response = self.client.get('/symbol/favorite/backup/?since=999', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_my_symbols_since_cursor(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.post('/symbol/enable/?id=501,502', **headers)
+        cursor = self.client.get('/symbol/', **headers).json().get('cursor')
+
+        response = self.client.get('/symbol/?since={}'.format(cursor), **headers)
+        self.assertEqual((response.json().get('my_symbols'), response.json().get('deleted')), ([], []))
+
+        Symbol.objects.create(id=504, text="test4", category=4, created_by=self.user)
+        self.client.post('/symbol/enable/?id=501,504', **headers)
+        response = self.client.get('/symbol/?since={}'.format(cursor), **headers)
+        self.assertEqual([symbol['id'] for symbol in response.json().get('my_symbols')], [504])
+        self.assertEqual(response.json().get('deleted'), [502])
+
     def test_enable_my_symbols_success(self):
         headers = {
             'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
@@ -102,3 +215,574 @@ class SymbolTest(TestCase):
         response = self.client.get('/symbol/501/', **headers)
         # Since symbol 501 is not valid yet
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_my_specific_symbol_fail_no_such_symbol(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        with self.assertNumQueries(3):  # etag, user, symbol
+            response = self.client.get('/symbol/999/', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pk', str(response.json()))
+
+    def test_favorite_unique_per_user(self):
+        FavoriteSymbol.objects.create(user=self.user, symbol_id=501)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FavoriteSymbol.objects.create(user=self.user, symbol_id=501)
+
+    def test_favorite_backup_fail_not_mine(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        other_user = User.objects.create_user(
+            email='other_email@gmail.com',
+            password='other_password',
+            nickname='other_nickname'
+        )
+        Symbol.objects.create(id=504, text="other", category=1, created_by=other_user)
+        response = self.client.post('/symbol/favorite/backup/?id=501,504', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('not_mine', str(response.json()))
+
+    def test_enable_my_symbols_fail_invalid_id(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        response = self.client.post('/symbol/enable/?id=501,abc', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Symbol.objects.filter(created_by=self.user).count(), 3)
+
+        response = self.client.post('/symbol/enable/?id=501.0', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(Symbol.objects.filter(created_by=self.user).values_list('id', flat=True)), [501])
+
+    def test_enable_same_symbols_keeps_version(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        self.client.post('/symbol/enable/?id=501', **headers)
+        cursor = self.client.get('/symbol/', **headers).json()['cursor']
+
+        self.client.post('/symbol/enable/?id=501', **headers)
+        self.assertEqual(self.client.get('/symbol/', **headers).json()['cursor'], cursor)
+
+    def test_symbol_list_validation_single_query(self):
+        data = [{'id': 501}, {'id': 502}, {'id': 503}, {'id': 505}]
+        serializer = FavoriteBackupSerializer(data=data, context={'user': self.user}, many=True)
+        with self.assertNumQueries(1):
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors[3], {'id': ['Invalid symbol (no such symbol)']})
+
+    def test_symbol_list_validation_decimal_ids(self):
+        data = [{'id': '501.0'}, {'id': 502.0}]
+        serializer = FavoriteBackupSerializer(data=data, context={'user': self.user}, many=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual([item['symbol_id'] for item in serializer.validated_data], [501, 502])
+
+
+def make_image(format, size=(600, 400), mode='RGB', **params):
+    buffer = BytesIO()
+    Image.new(mode, size, color='red').save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+class SymbolImageTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test_email@gmail.com',
+            password='test_password',
+            nickname='test_nickname'
+        )
+        self.media_root = tempfile.TemporaryDirectory()
+        self.local_storage = override_settings(
+            DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage',
+            MEDIA_ROOT=self.media_root.name,
+        )
+        self.local_storage.enable()
+
+        # symbols created by users get ids after the default ones
+        Symbol.objects.create(id=500, text="default", category=1)
+
+    def tearDown(self):
+        self.local_storage.disable()
+        self.media_root.cleanup()
+
+    def test_ingest_strips_metadata_and_builds_variants(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'  # camera make
+        upload = SimpleUploadedFile('photo.jpg', make_image('JPEG', exif=exif.tobytes()))
+
+        image = ingest_symbol_image(upload)
+        original = Image.open(BytesIO(image.original.read()))
+        self.assertEqual(original.format, 'JPEG')
+        self.assertNotIn('exif', original.info)
+        self.assertEqual(sorted(image.variants), [128, 256])
+        variant = Image.open(BytesIO(image.variants[128].read()))
+        self.assertEqual(variant.size, (128, 85))
+        self.assertEqual(variant.format, VARIANT_FORMAT)
+
+    @override_settings(SYMBOL_IMAGE_MAX_PIXELS=100 * 100)
+    def test_ingest_rejects_images_over_pixel_budget(self):
+        with self.assertRaises(ValueError):
+            ingest_symbol_image(SimpleUploadedFile('big.png', make_image('PNG', size=(101, 100))))
+
+    def test_backup_my_symbol_with_variants(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'image': SimpleUploadedFile('apple.png', make_image('PNG', mode='RGBA')),
+        }
+        response = self.client.post('/symbol/backup/', data, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(response.json().get('variants')), ['128', '256'])
+
+        self.client.post('/symbol/enable/?id={}'.format(response.json().get('id')), **headers)
+        response = self.client.get('/symbol/', **headers)
+        self.assertEqual(len(response.json().get('my_symbols')[0]['variants']), 2)
+
+    def test_backup_same_image_is_stored_once(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        content = make_image('PNG')
+        ids = []
+        for text in ['apple', 'banana']:
+            data = {
+                'text': text,
+                'category': 1,
+                'image': SimpleUploadedFile('apple.png', content),
+            }
+            response = self.client.post('/symbol/backup/', data, **headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.append(response.json().get('id'))
+
+        # the digest alone is enough once the server has the bytes
+        data = {
+            'text': 'cherry',
+            'category': 1,
+            'image_sha256': hashlib.sha256(content).hexdigest(),
+        }
+        response = self.client.post('/symbol/backup/', data, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids.append(response.json().get('id'))
+
+        stored = StoredImage.objects.get()
+        self.assertEqual(stored.refcount, 3)
+        self.assertEqual(set(Symbol.objects.filter(id__in=ids).values_list('image', flat=True)), {stored.name})
+
+        # the streamed uploads are staged copies, dropped right away
+        self.assertEqual(PendingImageDeletion.objects.filter(name__startswith='upload/').count(), 2)
+        stored_images = PendingImageDeletion.objects.filter(name__startswith='symbol/')
+
+        # the files are only queued for deletion with the last reference
+        self.client.post('/symbol/enable/?id={}'.format(ids[0]), **headers)
+        self.assertEqual(StoredImage.objects.get().refcount, 1)
+        self.assertFalse(stored_images.exists())
+
+        self.client.post('/symbol/enable/', **headers)
+        self.assertFalse(StoredImage.objects.exists())
+        self.assertEqual(stored_images.count(), 3)  # image and its two variants
+
+    def test_backup_my_symbol_failed_insert_queues_uploaded_files(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'image': SimpleUploadedFile('apple.png', make_image('PNG')),
+        }
+        with mock.patch('entry.serializers.Symbol.objects.create', side_effect=IntegrityError('broken')), \
+                self.assertRaises(IntegrityError):
+            self.client.post('/symbol/backup/', data, **headers)
+
+        self.assertFalse(StoredImage.objects.exists())
+        # image and its two variants, put in storage before the transaction
+        self.assertEqual(PendingImageDeletion.objects.filter(name__startswith='symbol/').count(), 3)
+
+    def test_backup_my_symbol_fail_unknown_digest(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'image_sha256': '0' * 64,
+        }
+        response = self.client.post('/symbol/backup/', data, **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_backup_my_symbol_digest_of_other_users_image(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        content = make_image('PNG')
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'image': SimpleUploadedFile('apple.png', content),
+        }
+        self.client.post('/symbol/backup/', data, **headers)
+
+        User.objects.create_user(email='other@gmail.com', password='test_password', nickname='other')
+        response = self.client.post('/user/login/', {'email': 'other@gmail.com', 'password': 'test_password'})
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {response.json().get("access")}'
+        }
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'image_sha256': hashlib.sha256(content).hexdigest(),
+        }
+        response = self.client.post('/symbol/backup/', data, **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # with the bytes the stored copy is shared
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'image': SimpleUploadedFile('apple.png', content),
+        }
+        response = self.client.post('/symbol/backup/', data, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(StoredImage.objects.get().refcount, 2)
+
+    def test_backup_my_symbol_fail_not_an_image(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'image': SimpleUploadedFile('apple.png', b'not an image'),
+        }
+        response = self.client.post('/symbol/backup/', data, **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_backup_my_symbol_streams_image_to_storage(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        content = make_image('PNG')
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'image': SimpleUploadedFile('apple.png', content),
+        }
+        with mock.patch('entry.serializers.image_digest') as image_digest:
+            response = self.client.post('/symbol/backup/', data, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        image_digest.assert_not_called()  # hashed while streaming
+        self.assertEqual(StoredImage.objects.get().digest, hashlib.sha256(content).hexdigest())
+
+        staged = PendingImageDeletion.objects.get().name
+        with open(os.path.join(self.media_root.name, staged), 'rb') as file:
+            self.assertEqual(file.read(), content)
+
+    @override_settings(SYMBOL_IMAGE_MAX_PIXELS=100 * 100)
+    def test_backup_my_symbol_fail_rejected_from_header(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'image': SimpleUploadedFile('big.png', make_image('PNG', size=(101, 100))),
+        }
+        with mock.patch('entry.serializers.ingest_symbol_image') as ingest:
+            response = self.client.post('/symbol/backup/', data, **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        ingest.assert_not_called()
+        self.assertFalse(os.path.exists(os.path.join(self.media_root.name, PendingImageDeletion.objects.get().name)))
+
+    @override_settings(SYMBOL_UPLOAD_MAX_BYTES=1024)
+    def test_backup_my_symbol_fail_too_large(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'image': SimpleUploadedFile('noise.bin', os.urandom(4096)),
+        }
+        response = self.client.post('/symbol/backup/', data, **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Symbol.objects.filter(created_by=self.user).exists())
+
+    def test_streamed_upload_to_s3_multipart(self):
+        client = mock.Mock()
+        client.create_multipart_upload.return_value = {'UploadId': 'u1'}
+        client.upload_part.side_effect = lambda **kwargs: {'ETag': 'etag{}'.format(kwargs['PartNumber'])}
+        storage = mock.Mock(bucket=mock.Mock(meta=mock.Mock(client=client)))
+        storage.bucket.name = 'bucket'
+        storage._normalize_name.side_effect = lambda name: 'media/' + name
+
+        request = mock.Mock(user=self.user)
+        with mock.patch('entry.upload_handlers.symbol_storage', return_value=storage), \
+                mock.patch.object(_S3MultipartSink, 'PART_SIZE', 4):
+            handler = StreamingSymbolUploadHandler(request)
+            with self.assertRaises(StopFutureHandlers):
+                handler.new_file('image', 'apple.png', 'image/png', None)
+            for start, chunk in [(0, b'abcde'), (5, b'fg')]:
+                self.assertIsNone(handler.receive_data_chunk(chunk, start))
+            upload = handler.file_complete(7)
+
+        self.assertEqual((upload.size, upload.key), (7, handler.keys[0]))
+        self.assertEqual(upload.digest, hashlib.sha256(b'abcdefg').hexdigest())
+        self.assertEqual([call.kwargs['Body'] for call in client.upload_part.call_args_list], [b'abcde', b'fg'])
+        client.complete_multipart_upload.assert_called_once_with(
+            Bucket='bucket', Key='media/' + handler.keys[0], UploadId='u1',
+            MultipartUpload={'Parts': [{'ETag': 'etag1', 'PartNumber': 1}, {'ETag': 'etag2', 'PartNumber': 2}]})
+
+    def test_direct_upload_success(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'content_type': 'image/png',
+        }
+        response = self.client.post('/symbol/upload/', data, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        upload_id = response.json().get('upload_id')
+        url = response.json().get('url')
+        fields = response.json().get('fields')
+
+        # confirming before the file is in storage fails
+        response = self.client.post('/symbol/upload/{}/confirm/'.format(upload_id), **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIsNone(SymbolUpload.objects.get(id=upload_id).confirm_started_at)
+
+        # the form is posted without the user's credentials, as to S3
+        form = dict(fields, file=SimpleUploadedFile('apple.png', make_image('PNG')))
+        response = self.client.post(url, form)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.post('/symbol/upload/{}/confirm/'.format(upload_id), **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(response.json().get('variants')), ['128', '256'])
+
+        symbol = Symbol.objects.get(id=response.json().get('id'))
+        self.assertEqual((symbol.text, symbol.created_by), ('apple', self.user))
+        self.assertEqual(symbol.image.name, StoredImage.objects.get().name)
+        self.assertFalse(SymbolUpload.objects.exists())
+        self.assertEqual(PendingImageDeletion.objects.get().name, fields['key'])
+
+        # an upload is confirmed only once
+        response = self.client.post('/symbol/upload/{}/confirm/'.format(upload_id), **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_direct_upload_confirm_in_progress(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'content_type': 'image/png',
+        }
+        response = self.client.post('/symbol/upload/', data, **headers)
+        upload_id = response.json().get('upload_id')
+        form = dict(response.json().get('fields'), file=SimpleUploadedFile('apple.png', make_image('PNG')))
+        self.client.post(response.json().get('url'), form)
+
+        # another request is checking the file
+        SymbolUpload.objects.filter(id=upload_id).update(confirm_started_at=timezone.now())
+        response = self.client.post('/symbol/upload/{}/confirm/'.format(upload_id), **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Symbol.objects.filter(created_by=self.user).exists())
+
+        # it died: the claim is taken over once it is older than the timeout
+        SymbolUpload.objects.filter(id=upload_id).update(
+            confirm_started_at=timezone.now() - datetime.timedelta(seconds=settings.SYMBOL_UPLOAD_CONFIRM_TIMEOUT + 1))
+        response = self.client.post('/symbol/upload/{}/confirm/'.format(upload_id), **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_direct_upload_fail_not_an_image(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'content_type': 'image/png',
+        }
+        response = self.client.post('/symbol/upload/', data, **headers)
+        upload_id = response.json().get('upload_id')
+        form = dict(response.json().get('fields'), file=SimpleUploadedFile('apple.png', b'not an image'))
+        self.client.post(response.json().get('url'), form)
+
+        response = self.client.post('/symbol/upload/{}/confirm/'.format(upload_id), **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Symbol.objects.filter(created_by=self.user).exists())
+
+    def test_direct_upload_fail_tampered_form(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'content_type': 'image/png',
+        }
+        response = self.client.post('/symbol/upload/', data, **headers)
+        form = dict(response.json().get('fields'), key='symbol/elsewhere.png',
+                    file=SimpleUploadedFile('apple.png', make_image('PNG')))
+        response = self.client.post(response.json().get('url'), form)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_direct_upload_fail_unsupported_type(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        data = {
+            'text': 'apple',
+            'category': 1,
+            'content_type': 'application/pdf',
+        }
+        response = self.client.post('/symbol/upload/', data, **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_direct_upload_presigned_post_on_s3(self):
+        client = mock.Mock()
+        client.generate_presigned_post.return_value = {'url': 'https://bucket.s3', 'fields': {'key': 'media/x'}}
+        storage = mock.Mock(bucket=mock.Mock(meta=mock.Mock(client=client)))
+        storage.bucket.name = 'bucket'
+        storage._normalize_name.side_effect = lambda name: 'media/' + name
+
+        upload = SymbolUpload(user=self.user, key='upload/x', text='apple', category=1, content_type='image/png')
+        url, fields = upload_target(storage, upload, request=None)
+        self.assertEqual(url, 'https://bucket.s3')
+        kwargs = client.generate_presigned_post.call_args.kwargs
+        self.assertEqual(kwargs['Key'], 'media/upload/x')
+        self.assertIn(['content-length-range', 1, settings.SYMBOL_UPLOAD_MAX_BYTES], kwargs['Conditions'])
+
+    def login(self):
+        data = {
+            'email': 'test_email@gmail.com',
+            'password': 'test_password',
+        }
+        return self.client.post('/user/login/', data).json().get('access')
+
+
+class StorageGarbageCollectionTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test_email@gmail.com',
+            password='test_password',
+            nickname='test_nickname'
+        )
+        self.media_root = tempfile.TemporaryDirectory()
+        self.storage = FileSystemStorage(location=self.media_root.name)
+
+    def tearDown(self):
+        self.media_root.cleanup()
+
+    def test_enable_queues_images_of_deleted_symbols(self):
+        Symbol.objects.create(id=501, text="keep", category=1, created_by=self.user)
+        Symbol.objects.create(id=502, text="drop", category=1, created_by=self.user, image='symbol/user_1/drop.png')
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        response = self.client.post('/symbol/enable/?id=501', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Symbol.objects.filter(id=502).exists())
+        self.assertEqual(list(PendingImageDeletion.objects.values_list('name', flat=True)), ['symbol/user_1/drop.png'])
+
+    def test_delete_pending_images(self):
+        name = self.storage.save('symbol/user_1/old.png', ContentFile(b'image'))
+        PendingImageDeletion.objects.enqueue([name])
+
+        stats = delete_pending_images(self.storage)
+        self.assertEqual(stats['deleted'], 1)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(PendingImageDeletion.objects.exists())
+
+    def test_delete_pending_images_records_failures(self):
+        PendingImageDeletion.objects.enqueue(['symbol/user_1/a.png', 'symbol/user_1/b.png'])
+        s3 = mock.Mock()
+        s3.bucket.name = 'bucket'
+        s3._normalize_name = lambda name: 'media/' + name
+        s3.bucket.meta.client.delete_objects.return_value = {
+            'Errors': [{'Key': 'media/symbol/user_1/b.png', 'Code': 'AccessDenied', 'Message': 'Access Denied'}]
+        }
+
+        stats = delete_pending_images(s3)
+        self.assertEqual((stats['deleted'], stats['failed']), (1, 1))
+        s3.bucket.meta.client.delete_objects.assert_called_once()
+        failed = PendingImageDeletion.objects.get()
+        self.assertEqual((failed.name, failed.attempts, failed.last_error), ('symbol/user_1/b.png', 1, 'Access Denied'))
+
+    def test_delete_pending_images_without_retries(self):
+        name = self.storage.save('symbol/user_1/old.png', ContentFile(b'image'))
+        PendingImageDeletion.objects.enqueue([name])
+
+        stats = delete_pending_images(self.storage, retries=0)
+        self.assertEqual(stats['deleted'], 1)
+        self.assertFalse(self.storage.exists(name))
+
+    def test_collect_orphan_symbols(self):
+        Symbol.objects.create(id=501, text="enabled", category=1, created_by=self.user, is_valid=True)
+        Symbol.objects.create(id=502, text="orphan", category=1, created_by=self.user, image='symbol/user_1/o.png')
+        Symbol.objects.filter(id=502).update(created_at=timezone.now() - datetime.timedelta(days=30))
+        Symbol.objects.create(id=503, text="uploading", category=1, created_by=self.user)
+
+        self.assertEqual(collect_orphan_symbols(datetime.timedelta(days=7)), 1)
+        self.assertEqual(sorted(Symbol.objects.values_list('id', flat=True)), [501, 503])
+        self.assertEqual(PendingImageDeletion.objects.get().name, 'symbol/user_1/o.png')
+
+    def test_collect_orphan_symbols_removes_their_favorites(self):
+        Symbol.objects.create(id=501, text="enabled", category=1, created_by=self.user, is_valid=True)
+        Symbol.objects.create(id=502, text="orphan", category=1, created_by=self.user)
+        Symbol.objects.filter(id=502).update(created_at=timezone.now() - datetime.timedelta(days=30))
+        FavoriteSymbol.objects.create(user=self.user, symbol_id=501)
+        FavoriteSymbol.objects.create(user=self.user, symbol_id=502)
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.login()}'
+        }
+        response = self.client.get('/symbol/favorite/backup/', **headers)
+        cursor = response.data['cursor']
+
+        self.assertEqual(collect_orphan_symbols(datetime.timedelta(days=7)), 1)
+        response = self.client.get('/symbol/favorite/backup/', **headers)
+        self.assertEqual(response.data['cursor'], cursor + 1)
+        response = self.client.get(f'/symbol/favorite/backup/?since={cursor}', **headers)
+        self.assertEqual(response.data['deleted'], [502])
+
+    def test_collect_orphan_symbols_keeps_symbols_enabled_meanwhile(self):
+        Symbol.objects.create(id=502, text="orphan", category=1, created_by=self.user, image='symbol/user_1/o.png')
+        Symbol.objects.filter(id=502).update(created_at=timezone.now() - datetime.timedelta(days=30))
+
+        # A backup enables the symbol after the batch was read, before it is deleted
+        atomic = transaction.atomic
+        def enable_first(*args, **kwargs):
+            Symbol.objects.filter(id=502).update(is_valid=True)
+            return atomic(*args, **kwargs)
+        with mock.patch('entry.storage_gc.transaction.atomic', side_effect=enable_first):
+            self.assertEqual(collect_orphan_symbols(datetime.timedelta(days=7)), 0)
+        self.assertTrue(Symbol.objects.filter(id=502).exists())
+        self.assertFalse(PendingImageDeletion.objects.exists())
+
+    def test_collect_expired_uploads(self):
+        old = SymbolUpload.objects.create(user=self.user, key='upload/user_1/old', text='a', category=1,
+                                          content_type='image/png')
+        SymbolUpload.objects.filter(id=old.id).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        SymbolUpload.objects.create(user=self.user, key='upload/user_1/new', text='b', category=1,
+                                    content_type='image/png')
+
+        self.assertEqual(collect_expired_uploads(datetime.timedelta(minutes=10)), 1)
+        self.assertEqual(list(SymbolUpload.objects.values_list('key', flat=True)), ['upload/user_1/new'])
+        self.assertEqual(PendingImageDeletion.objects.get().name, 'upload/user_1/old')
+
+    def login(self):
+        data = {
+            'email': 'test_email@gmail.com',
+            'password': 'test_password',
+        }
+        return self.client.post('/user/login/', data).json().get('access')
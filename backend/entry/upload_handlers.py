@@ -0,0 +1,178 @@
+import hashlib
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from entry.direct_upload import symbol_storage, upload_key
+
+# How much of the file is kept to read the image header from
+HEADER_SNIFF_LIMIT = 256 * 1024
+
+
+class StreamedUpload(UploadedFile):
+    # An `image` field already written to storage under `key` while the request
+    # was read. The bytes are fetched back only if the image has to be decoded.
+
+    def __init__(self, storage, key, name, content_type, size, digest):
+        super().__init__(None, name, content_type, size)
+        self.storage = storage
+        self.key = key
+        self.digest = digest
+
+    def open(self, mode='rb'):
+        if self.file is None:
+            self.file = self.storage.open(self.key, mode)
+        else:
+            self.file.seek(0)
+        return self
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class _S3MultipartSink:
+    # Every part but the last must be at least 5 MB, so at most one part is buffered.
+    # Parts of uploads that die with the process are removed by the bucket's
+    # AbortIncompleteMultipartUpload lifecycle rule.
+    PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, storage, key, content_type):
+        self.client = storage.bucket.meta.client
+        self.params = {'Bucket': storage.bucket.name, 'Key': storage._normalize_name(key)}
+        self.upload_id = self.client.create_multipart_upload(
+            ContentType=content_type or 'application/octet-stream', **self.params)['UploadId']
+        self.parts = []
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.PART_SIZE:
+            self._upload_part()
+
+    def _upload_part(self):
+        number = len(self.parts) + 1
+        response = self.client.upload_part(
+            PartNumber=number, UploadId=self.upload_id, Body=bytes(self.buffer), **self.params)
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': number})
+        self.buffer.clear()
+
+    def close(self):
+        if self.buffer or not self.parts:
+            self._upload_part()
+        self.client.complete_multipart_upload(
+            UploadId=self.upload_id, MultipartUpload={'Parts': self.parts}, **self.params)
+
+    def abort(self):
+        self.client.abort_multipart_upload(UploadId=self.upload_id, **self.params)
+
+
+class _LocalSink:
+    # Local storage stand-in (FileSystemStorage in tests and development)
+
+    def __init__(self, storage, key, content_type):
+        path = storage.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.file = open(path, 'wb')
+
+    def write(self, data):
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.path)
+
+
+class StreamingSymbolUploadHandler(FileUploadHandler):
+    # Upload handler for MySymbolBackupView: the `image` field goes straight
+    # from the request body to storage, hashed and size-checked on the way, so
+    # a worker holds at most one chunk (one part on S3) of it. Oversized bodies
+    # and files whose header is not an image within the pixel budget are
+    # rejected before the rest of the file is read.
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.storage = symbol_storage()
+        self.keys = []  # staged objects, for the view to queue for deletion
+        self.sink = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # The form fields besides the image are a few bytes
+        if content_length and content_length > settings.SYMBOL_UPLOAD_MAX_BYTES + 64 * 1024:
+            raise ValidationError({"image": ["The file is too large"]})
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        if field_name != 'image':
+            self.sink = None
+            return
+
+        key = upload_key(self.request.user)
+        self.keys.append(key)
+        sink_class = _S3MultipartSink if getattr(self.storage, 'bucket', None) is not None else _LocalSink
+        self.sink = sink_class(self.storage, key, self.content_type)
+        self.key = key
+        self.digest = hashlib.sha256()
+        self.header = bytearray()
+        self.checked_header = False
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.sink is None:
+            return raw_data
+
+        if start + len(raw_data) > settings.SYMBOL_UPLOAD_MAX_BYTES:
+            self._abort()
+            raise ValidationError({"image": ["The file is too large"]})
+        if not self.checked_header:
+            self._check_header(raw_data)
+
+        self.digest.update(raw_data)
+        self.sink.write(raw_data)
+        return None
+
+    def _check_header(self, raw_data):
+        self.header += raw_data
+        try:
+            image = Image.open(BytesIO(self.header))
+        except Image.DecompressionBombError:
+            self._abort()
+            raise ValidationError({"image": ["Upload a valid image (unsupported format, broken or too large)"]})
+        except Exception:
+            # Not enough of the header yet; after the limit, ingest decides
+            if len(self.header) >= HEADER_SNIFF_LIMIT:
+                self.checked_header = True
+            return
+
+        self.checked_header = True
+        self.header = bytearray()
+        width, height = image.size
+        if width * height > settings.SYMBOL_IMAGE_MAX_PIXELS:
+            self._abort()
+            raise ValidationError({"image": ["Upload a valid image (unsupported format, broken or too large)"]})
+
+    def _abort(self):
+        sink, self.sink = self.sink, None
+        sink.abort()
+
+    def file_complete(self, file_size):
+        if self.sink is None:
+            return None
+
+        sink, self.sink = self.sink, None
+        sink.close()
+        return StreamedUpload(self.storage, self.key, self.file_name, self.content_type, file_size,
+                              self.digest.hexdigest())
+
+    def upload_interrupted(self):
+        if self.sink is not None:
+            self._abort()
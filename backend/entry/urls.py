@@ -5,6 +5,9 @@ from . import views
 app_name = 'entry'
 urlpatterns = [
     path('backup/', views.MySymbolBackupView.as_view(), name='backup my symbol'),
+    path('upload/', views.SymbolUploadView.as_view(), name='request symbol upload'),
+    path('upload/<int:pk>/confirm/', views.SymbolUploadConfirmView.as_view(), name='confirm symbol upload'),
+    path('upload/local/', views.LocalUploadView.as_view(), name='upload symbol image locally'),
     path('', views.MySymbolRetrieveView.as_view(), name='get all of my symbols'),
     path('<int:pk>/', views.MySymbolRetrieveView.as_view(), name='get my specific symbol'),
     path('favorite/backup/', views.FavoriteBackupView.as_view(), name='backup favorite symbol'),
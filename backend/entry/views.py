@@ -1,96 +1,313 @@
-import boto3
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.exceptions import ValidationError
 
-from config import settings
-from entry.models import FavoriteSymbol, Symbol
-from entry.serializers import FavoriteBackupSerializer, MySymbolBackupSerializer, MySymbolEnableSerializer
+from backup.cache import cached_section, invalidate_section
+from backup.idempotency import idempotent
+from backup.locking import atomic_with_retry
+from backup.manifest import symbol_row, update_manifest
+from backup.sync import check_cursor, deleted_since, parse_since, record_tombstones
+from backup.versions import FAVORITES, SYMBOLS, bump_section_version, get_section_version, lock_section_version, \
+    section_etag
+from entry.direct_upload import check_local_upload, is_being_confirmed, is_expired, symbol_storage, upload_target
+from entry.models import FavoriteSymbol, PendingImageDeletion, Symbol, SymbolUpload
+from entry.serializers import FavoriteBackupSerializer, MySymbolBackupSerializer, MySymbolEnableSerializer, \
+    SymbolUploadSerializer
+from entry.image_store import release_symbol_images
+from entry.upload_handlers import StreamingSymbolUploadHandler
+
+
+def check_symbol_ids(symbol_ids):
+    if not isinstance(symbol_ids, list) or not all(isinstance(x, (int, str)) for x in symbol_ids):
+        raise ValidationError({"id": ["Expected a list of symbol ids"]})
+    return symbol_ids
+
+
+# Section read/write shared by the views below and backup.views.BundleView
+
+def backup_favorites(user, symbol_ids):
+    unique_ids = set(symbol_ids)  # to handle duplicate values
+    data = [{'id': x} for x in unique_ids]
+
+    serializer = FavoriteBackupSerializer(data=data, context={'user': user}, many=True)
+    serializer.is_valid(raise_exception=True)
+    requested = {item['symbol_id'] for item in serializer.validated_data}
+
+    # Apply the difference between the stored and the requested favorites
+    def write():
+        version = lock_section_version(user, FAVORITES)
+        current = set(FavoriteSymbol.objects.filter(user=user).values_list('symbol_id', flat=True))
+        added = requested - current
+        removed = current - requested
+
+        if added or removed:
+            version.version += 1
+            version.save()
+            FavoriteSymbol.objects.bulk_create(
+                [FavoriteSymbol(user=user, symbol_id=symbol_id, version=version.version) for symbol_id in added]
+            )
+            FavoriteSymbol.objects.filter(user=user, symbol_id__in=removed).delete()
+            record_tombstones(user, FAVORITES, removed, version.version)
+            update_manifest(user, FAVORITES, version.version, added=[symbol_row(symbol_id) for symbol_id in added],
+                            removed=[symbol_row(symbol_id) for symbol_id in removed])
+            invalidate_section(user.id, FAVORITES)
+
+    atomic_with_retry(FAVORITES, write)
+
+
+@cached_section(FAVORITES)
+def get_favorites(user, since=None):
+    cursor = get_section_version(user, FAVORITES)
+    check_cursor(user, FAVORITES, since, cursor)
+
+    favorites = FavoriteSymbol.objects.filter(user=user)
+    if since is not None:
+        favorites = favorites.filter(version__gt=since)
+    response_data = FavoriteBackupSerializer(favorites, many=True).data
+    response_data = {
+        "results": response_data,
+        "cursor": cursor
+    }
+    if since is not None:
+        added = {item['id'] for item in response_data['results']}
+        response_data["deleted"] = sorted(deleted_since(user, FAVORITES, since) - added)
+    return response_data
+
+
+def enable_my_symbols(user, symbol_ids):
+    data = [{'id': x} for x in set(symbol_ids)]
+
+    serializer = MySymbolEnableSerializer(data=data, context={'user': user}, many=True)
+    serializer.is_valid(raise_exception=True)
+
+    ### After all validations are done
+    def write():
+        version = lock_section_version(user, SYMBOLS)
+
+        enabled_ids = [item['id'] for item in serializer.validated_data]
+        newly_enabled = list(
+            Symbol.objects.filter(id__in=enabled_ids, is_valid=False).values_list('id', flat=True))
+        symbols_to_delete = Symbol.objects.filter(created_by=user).exclude(id__in=enabled_ids)
+        deleted_ids = list(symbols_to_delete.filter(is_valid=True).values_list('id', flat=True))
+
+        # The same symbols again keep the version, so ETags and cached copies stay valid
+        if newly_enabled or deleted_ids:
+            version.version += 1
+            version.save()
+            invalidate_section(user.id, SYMBOLS)
+
+            # Enabling process
+            Symbol.objects.filter(id__in=newly_enabled).update(is_valid=True, version=version.version)
+
+            # Deleting process (images are removed later by collect_storage_garbage)
+            record_tombstones(user, SYMBOLS, deleted_ids, version.version)
+            update_manifest(user, SYMBOLS, version.version,
+                            added=[symbol_row(symbol_id) for symbol_id in newly_enabled],
+                            removed=[symbol_row(symbol_id) for symbol_id in deleted_ids])
+
+        # Favorites of the deleted symbols go with them (on_delete=CASCADE)
+        lost_favorites = list(
+            FavoriteSymbol.objects.filter(symbol__in=symbols_to_delete).values_list('symbol_id', flat=True))
+        if lost_favorites:
+            favorites_version = bump_section_version(user, FAVORITES)
+            record_tombstones(user, FAVORITES, lost_favorites, favorites_version)
+            update_manifest(user, FAVORITES, favorites_version,
+                            removed=[symbol_row(symbol_id) for symbol_id in lost_favorites])
+            invalidate_section(user.id, FAVORITES)
+
+        release_symbol_images(symbols_to_delete)
+        symbols_to_delete.delete()
+
+    atomic_with_retry(SYMBOLS, write)
+
+
+@cached_section(SYMBOLS)
+def get_my_symbols(user, since=None):
+    cursor = get_section_version(user, SYMBOLS)
+    check_cursor(user, SYMBOLS, since, cursor)
+
+    symbols = Symbol.objects.filter(created_by=user, is_valid=True).prefetch_related('variants')
+    if since is not None:
+        symbols = symbols.filter(version__gt=since)
+    serialized_symbols = MySymbolBackupSerializer(symbols, many=True).data
+    response_data = {"my_symbols": serialized_symbols, "cursor": cursor}
+    if since is not None:
+        response_data["deleted"] = sorted(deleted_since(user, SYMBOLS, since))
+    return response_data
 
 
 class FavoriteBackupView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
+    @idempotent
     def post(self, request):
         user = request.user
 
-        symbol_ids = request.query_params.get('id')
+        # JSON body {"id": [1, 2, 3]}; the comma separated ?id= query string is still accepted
+        if not isinstance(request.data, dict):
+            raise ValidationError({"id": ["Expected an object with a list of symbol ids"]})
+        symbol_ids = request.data.get('id')
         if symbol_ids is None:
-            data = []
-        else:
-            unique_ids = set(symbol_ids.split(','))  # to handle duplicate values
-            data = [{'id': int(x)} for x in unique_ids]
-
-        serializer = FavoriteBackupSerializer(data=data, context={'user': user}, many=True)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+            query = request.query_params.get('id')
+            symbol_ids = query.split(',') if query else []
+        backup_favorites(user, check_symbol_ids(symbol_ids))
 
-        # Delete favorite-symbol if user undid favorite-symbol registration
-        # Load all the favorite symbols (id values) of the user
-        # symbol_to_delete ultimately contains symbols to delete
-        favorite_symbols = FavoriteSymbol.objects.filter(user=user).values('symbol_id')
-        symbol_to_delete = [item['symbol_id'] for item in favorite_symbols]
+        return Response(status=status.HTTP_200_OK)
 
-        # Remove symbols that user tries to backup from the symbol_to_delete list
-        try:
-            for item in serializer.validated_data:
-                symbol_to_delete.remove(item.get('symbol_id'))
-        except ValueError:
-            pass
+    @method_decorator(condition(etag_func=section_etag(FAVORITES)))
+    def get(self, request):
+        response_data = get_favorites(request.user, parse_since(request))
+        return Response(response_data, status=status.HTTP_200_OK)
 
-        # Now, symbol_to_delete contains the symbol ids to delete
-        for id in symbol_to_delete:
-            symbol = Symbol.objects.get(id=id)
-            FavoriteSymbol.objects.get(user=user, symbol=symbol).delete()
 
-        return Response(status=status.HTTP_200_OK)
+# Backup user-created-symbol
+class MySymbolBackupView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
 
-    def get(self, request):
+    @idempotent
+    def post(self, request):
         user = request.user
-        favorites = FavoriteSymbol.objects.filter(user=user)
-        response_data = FavoriteBackupSerializer(favorites, many=True).data
+        # The image is streamed to storage while the body is parsed
+        upload_handler = StreamingSymbolUploadHandler(request)
+        request.upload_handlers.insert(0, upload_handler)
+
+        try:
+            data = request.data
+            # text, category를 key 값이 content인 json으로 받아올 때면
+            # json.loads(request.POST.get('content')) 이런 식으로 사용하면 됨
+
+            serializer = MySymbolBackupSerializer(data=data, context={'user': user})
+            serializer.is_valid(raise_exception=True)
+            my_symbol = serializer.save()
+        finally:
+            # The symbol keeps the content-addressed copy, not the staged upload
+            PendingImageDeletion.objects.enqueue(upload_handler.keys)
+
         response_data = {
-            "results": response_data
+            "id": my_symbol.id,
+            "image_url": my_symbol.image.url,
+            "variants": serializer.get_variants(my_symbol)
         }
+
         return Response(response_data, status=status.HTTP_200_OK)
 
 
-# Backup user-created-symbol
-class MySymbolBackupView(APIView):
+# Direct upload, phase 1: get a presigned form to upload the image to storage
+class SymbolUploadView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def post(self, request):
+        serializer = SymbolUploadSerializer(data=request.data, context={'user': request.user})
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.save()
+
+        url, fields = upload_target(symbol_storage(), upload, request)
+        response_data = {
+            "upload_id": upload.id,
+            "url": url,
+            "fields": fields,
+            "expires_in": settings.SYMBOL_UPLOAD_EXPIRES
+        }
+
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+# Direct upload, phase 2: check the uploaded object and create the symbol
+class SymbolUploadConfirmView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    @idempotent
+    def post(self, request, pk):
         user = request.user
-        data = request.data
-        # text, category를 key 값이 content인 json으로 받아올 때면
-        # json.loads(request.POST.get('content')) 이런 식으로 사용하면 됨
+        storage = symbol_storage()
+
+        # The upload is claimed in a short transaction of its own: reading the
+        # object from storage and decoding the image below hold no row lock
+        with transaction.atomic():
+            upload = SymbolUpload.objects.select_for_update().filter(id=pk, user=user).first()
+            if upload is None:
+                raise ValidationError({"upload_id": ["No such upload"]})
+            if is_expired(upload):
+                raise ValidationError({"upload_id": ["The upload has expired"]})
+            if is_being_confirmed(upload):
+                raise ValidationError({"upload_id": ["The upload is already being confirmed"]})
+            upload.confirm_started_at = timezone.now()
+            upload.save(update_fields=['confirm_started_at'])
 
-        serializer = MySymbolBackupSerializer(data=data, context={'user': user})
-        serializer.is_valid(raise_exception=True)
-        my_symbol = serializer.save()
+        try:
+            if not storage.exists(upload.key):
+                raise ValidationError({"image": ["The file has not been uploaded yet"]})
+            if storage.size(upload.key) > settings.SYMBOL_UPLOAD_MAX_BYTES:
+                raise ValidationError({"image": ["The file is too large"]})
+
+            # Same checks as a multipart backup: the image is decoded (type and
+            # pixel budget) unless the user already stores these bytes. The symbol
+            # is created in the serializer's own short transaction.
+            with storage.open(upload.key) as file:
+                data = {'text': upload.text, 'category': upload.category, 'image': file}
+                serializer = MySymbolBackupSerializer(data=data, context={'user': user})
+                serializer.is_valid(raise_exception=True)
+                my_symbol = serializer.save()
+        except BaseException:
+            # e.g. not uploaded yet: the client may confirm again
+            SymbolUpload.objects.filter(id=upload.id, confirm_started_at=upload.confirm_started_at) \
+                .update(confirm_started_at=None)
+            raise
+
+        # The image now lives under its content address
+        with transaction.atomic():
+            PendingImageDeletion.objects.enqueue([upload.key])
+            upload.delete()
 
         response_data = {
             "id": my_symbol.id,
-            "image_url": my_symbol.image.url
+            "image_url": my_symbol.image.url,
+            "variants": serializer.get_variants(my_symbol)
         }
 
         return Response(response_data, status=status.HTTP_200_OK)
 
 
+# Stand-in for the S3 presigned POST when media is on local storage (tests, development)
+class LocalUploadView(APIView):
+    permission_classes = (permissions.AllowAny,)
+    authentication_classes = ()
+
+    def post(self, request):
+        file = request.FILES.get('file')
+        if file is None:
+            raise ValidationError({"file": ["No file was submitted."]})
+        try:
+            key = check_local_upload(request.data, file)
+        except ValueError as e:
+            raise ValidationError({"token": [str(e)]})
+
+        storage = symbol_storage()
+        storage.delete(key)  # uploading again replaces the object, as on S3
+        storage.save(key, file)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 # Get information about user-created-symbol
 class MySymbolRetrieveView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
+    @method_decorator(condition(etag_func=section_etag(SYMBOLS)))
     def get(self, request, pk=None):
         user = request.user
 
         if pk is not None:
-            all_symbols = list(Symbol.objects.values_list('id', flat=True))
-            if pk not in all_symbols:
+            symbol = Symbol.objects.filter(id=pk).first()
+            if symbol is None:
                 raise ValidationError({"pk": ["invalid symbol (no such symbol)"]})
 
-            symbol = Symbol.objects.get(id=pk)
             if user != symbol.created_by:
                 raise ValidationError({"not_mine": ["the requested symbol is created by another user"]})
             if symbol.is_valid == False:
@@ -98,9 +315,7 @@ class MySymbolRetrieveView(APIView):
             serialized_symbol = MySymbolBackupSerializer(symbol).data
             response_data = {"my_symbol": serialized_symbol}
         else:
-            symbols = Symbol.objects.filter(created_by=user, is_valid=True)
-            serialized_symbols = MySymbolBackupSerializer(symbols, many=True).data
-            response_data = {"my_symbols": serialized_symbols}
+            response_data = get_my_symbols(user, parse_since(request))
 
         return Response(response_data, status=status.HTTP_200_OK)
 
@@ -109,52 +324,13 @@ class MySymbolRetrieveView(APIView):
 class MySymbolEnableView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
+    @idempotent
     def post(self, request):
         user = request.user
 
-        symbol_ids = request.query_params.get('id')
-        if symbol_ids is None:
-            data = []
-        else:
-            unique_ids = set(symbol_ids.split(','))
-            data = [{'id': int(x)} for x in unique_ids]
-
-        serializer = MySymbolEnableSerializer(data=data, context={'user': user}, many=True)
-        serializer.is_valid(raise_exception=True)
-
-        ### After all validations are done
-        # (Refer to FavoriteBackupView!)
-        # Load all the mysymbols (id values) of the user
-        my_symbols = Symbol.objects.filter(created_by=user).values('id')
-        symbol_to_delete = [item['id'] for item in my_symbols]
-
-        # Enabling process
-        for item in serializer.validated_data:
-            id = item['id']
-            symbol = Symbol.objects.get(id=id)
-            if not symbol.is_valid:
-                symbol.is_valid = True
-                symbol.save()
-            symbol_to_delete.remove(id)
-
-        # Deleting process
-        for id in symbol_to_delete:
-            symbol = Symbol.objects.get(id=id)
-
-            # delete image in s3
-            s3 = boto3.client(
-                's3',
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            )
-            key = "media/" + str(symbol.image)
-            bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-
-            try:
-                s3.delete_object(Bucket=bucket_name, Key=key)
-            except Exception as e:
-                print(f"Error: {e}")
-
-            symbol.delete()
+        # Comma separated; parsed (and rejected with a 400) by the serializer's IntegerField
+        query = request.query_params.get('id')
+        symbol_ids = query.split(',') if query else []
+        enable_my_symbols(user, check_symbol_ids(symbol_ids))
 
         return Response(status=status.HTTP_200_OK)
@@ -60,6 +60,30 @@ class SettingsTest(TestCase):
         self.assertEqual(data['default_menu'], 1)  # 1 is the default value
         self.assertEqual(data['auto_backup'], 1)
 
+    def test_get_settings_not_modified(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        etag = self.client.get('/setting/backup/', **headers)['ETag']
+        response = self.client.get('/setting/backup/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        data = {
+            'display_mode': 1,
+            'default_menu': 0,
+            'auto_backup': 1,
+        }
+        self.client.post('/setting/backup/', data, **headers)
+        response = self.client.get('/setting/backup/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['display_mode'], 1)
+
+        # the same settings again leave the version alone
+        etag = response['ETag']
+        self.client.post('/setting/backup/', data, **headers)
+        response = self.client.get('/setting/backup/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
 
 
 
@@ -1,47 +1,72 @@
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+
+from backup.cache import cached_section, invalidate_section
+from backup.idempotency import idempotent
+from backup.locking import atomic_with_retry
+from backup.manifest import replace_manifest, settings_row
+from backup.versions import SETTINGS, lock_section_version, section_etag
 from setup.models import Setting
 from setup.serializers import SettingBackupSerializer
 
 
-# Create your views here.
+# Section read/write shared by SettingBackupView and backup.views.BundleView
+
+def backup_settings(user, data):
+    serializer = SettingBackupSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    display_mode = serializer.validated_data['display_mode']
+    default_menu = serializer.validated_data['default_menu']
+    auto_backup = serializer.validated_data['auto_backup']
+
+    values = {
+        'display_mode': display_mode,
+        'default_menu': default_menu,
+        'auto_backup': auto_backup,
+    }
+
+    def write():
+        version = lock_section_version(user, SETTINGS)
+        setting = Setting.objects.filter(user=user).first()
+        if setting is not None and all(getattr(setting, field) == value for field, value in values.items()):
+            return  # the same settings again: ETags and cached copies stay valid
+
+        # One row per user (Setting.user is unique): update it, or create it on the first backup
+        setting, _ = Setting.objects.update_or_create(user=user, defaults=values)
+        version.version += 1
+        version.save()
+        replace_manifest(user, SETTINGS, version.version, [settings_row(setting)])
+        invalidate_section(user.id, SETTINGS)
+
+    atomic_with_retry(SETTINGS, write)
+
+
+@cached_section(SETTINGS)
+def get_settings(user):
+    curr_setting = Setting.objects.filter(user=user).first()
+    if curr_setting is None:
+        return {
+            "display_mode": 0,
+            "default_menu": 1,
+            "auto_backup": 1,
+            "updated_at": ""
+        }
+    return SettingBackupSerializer(curr_setting).data
+
+
 class SettingBackupView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
+    @idempotent
     def post(self, request):
-        user = request.user
-
-        serializer = SettingBackupSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        display_mode = serializer.validated_data['display_mode']
-        default_menu = serializer.validated_data['default_menu']
-        auto_backup = serializer.validated_data['auto_backup']
-
-        if not Setting.objects.filter(user=user).exists():
-            Setting.objects.create(display_mode=display_mode, default_menu=default_menu, auto_backup=auto_backup, user=user)
-        else:
-            curr_setting = Setting.objects.get(user=user)
-            curr_setting.display_mode = display_mode
-            curr_setting.default_menu = default_menu
-            curr_setting.auto_backup = auto_backup
-            curr_setting.save()
-
+        backup_settings(request.user, request.data)
         return Response(status=status.HTTP_200_OK)
 
+    @method_decorator(condition(etag_func=section_etag(SETTINGS)))
     def get(self, request):
-        user = request.user
-
-        if not Setting.objects.filter(user=user).exists():
-            response_data = {
-                "display_mode": 0,
-                "default_menu": 1,
-                "auto_backup": 1,
-                "updated_at": ""
-            }
-        else:
-            curr_setting = Setting.objects.get(user=user)
-            response_data = SettingBackupSerializer(curr_setting).data
-
+        response_data = get_settings(request.user)
         return Response(response_data, status=status.HTTP_200_OK)
 
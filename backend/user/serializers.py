@@ -5,7 +5,6 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 from user.models import EmailVerification
 from user.utils import normalize_email
-from weight_table.models import WeightTable
 
 User = get_user_model()
 
@@ -32,11 +31,8 @@ class UserSignUpSerializer(serializers.Serializer):
         nickname = validated_data.get('nickname')
         user = User.objects.create_user(nickname, email, password)
 
-        with open('./weight_table.txt', 'r') as file:
-            for symbol_id, line in enumerate(file, start=1):
-                weight = f"[{line}]"
-                WeightTable.objects.create(symbol_id=symbol_id, weight=weight, user=user)
-
+        # Weight rows are not seeded here: a new user reads the shared default
+        # table until they upload something different (see weight_table.defaults)
         return user
 
 
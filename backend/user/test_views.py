@@ -1,7 +1,9 @@
 from django.test import TestCase
 from rest_framework import status
 
+from entry.models import PendingImageDeletion, SymbolUpload
 from user.models import User, EmailVerification
+from weight_table.models import WeightTable
 
 
 class UserTest(TestCase):
@@ -35,6 +37,9 @@ class UserTest(TestCase):
         }
         response = self.client.post('/user/signup/', data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # the default weight table is shared, not copied per user
+        new_user = User.objects.get(email='this_is_test@gmail.com')
+        self.assertFalse(WeightTable.objects.filter(user=new_user).exists())
 
     def test_login_success(self):
         data = {
@@ -78,8 +83,12 @@ class UserTest(TestCase):
         data = {
             'refresh': self.refresh_token
         }
+        upload = SymbolUpload.objects.create(user=self.user, key='upload/user_{}/abc'.format(self.user.id),
+                                             text='apple', category=1, content_type='image/png')
         response = self.client.post('/user/withdraw/', data, **headers)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # files uploaded directly but never confirmed are queued for deletion
+        self.assertEqual(list(PendingImageDeletion.objects.values_list('name', flat=True)), [upload.key])
 
     def test_change_nickname_success(self):
         headers = {
@@ -1,4 +1,3 @@
-import boto3
 from django.contrib.auth import get_user_model
 from django.core.mail import EmailMessage
 from django.db import transaction
@@ -8,9 +7,9 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from config import settings
 from config.utils import AccessToken
-from entry.models import Symbol
+from entry.models import PendingImageDeletion, Symbol, SymbolUpload
+from entry.image_store import release_symbol_images
 from .models import EmailVerification
 
 from .serializers import UserSignUpSerializer, UserLoginSerializer, UserLogoutSerializer, EmailCheckSerializer, \
@@ -179,24 +178,14 @@ class UserWithdrawView(APIView):
     def post(self, request):
         user = request.user
 
-        # delete user's symbol images in s3
-        symbols = Symbol.objects.filter(created_by=user)
-        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        s3 = boto3.client(
-            's3',
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        )
-        for symbol in symbols:
-            key = "media/" + str(symbol.image)
-            try:
-                s3.delete_object(Bucket=bucket_name, Key=key)
-            except Exception as e:
-                print(f"Error: {e}")
-
         # Don't know why, but if we attempt to delete the user after blacklisting the token,
         # the blacklisting doesn't work properly as expected
-        request.user.delete()
+        with transaction.atomic():
+            # queue user's symbol images in s3 for deletion (see collect_storage_garbage),
+            # and whatever was uploaded directly but never confirmed
+            release_symbol_images(Symbol.objects.filter(created_by=user))
+            PendingImageDeletion.objects.enqueue(SymbolUpload.objects.filter(user=user).values_list('key', flat=True))
+            request.user.delete()
 
         serializer = UserLogoutSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class WeightTableConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'weight_table'
+
+    def ready(self):
+        from weight_table.defaults import load_default_weights
+
+        # Map the default table once when the worker starts, not on the first request
+        load_default_weights()
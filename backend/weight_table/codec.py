@@ -0,0 +1,115 @@
+import struct
+
+import numpy
+
+# Packed layout of WeightTable.weight
+#   header : format (uint8) + number of columns (uint16)
+#   dense  : one int32 per column
+#   sparse : (column index uint16, value int32) pair per non-zero column
+# Everything is little-endian. encode_weight picks whichever form is shorter,
+# so rows that are mostly zeros (which is most of them) stay tiny.
+DENSE = 0
+SPARSE = 1
+
+_HEADER = struct.Struct('<BH')
+_MAX_COLUMNS = 0xFFFF
+_INT32_MIN = -2 ** 31
+_INT32_MAX = 2 ** 31 - 1
+
+
+def parse_weight(text):
+    # "[0,3,0,...]" (the format the app sends) -> [0, 3, 0, ...]
+    body = text.strip()
+    if body.startswith('['):
+        body = body[1:]
+    if body.endswith(']'):
+        body = body[:-1]
+    if not body.strip():
+        return []
+    return [int(value) for value in body.split(',')]
+
+
+def format_weight(values):
+    return '[' + ','.join(str(value) for value in values) + ']'
+
+
+def check_weight(values):
+    if len(values) > _MAX_COLUMNS:
+        raise ValueError('too many columns ({})'.format(len(values)))
+    for value in values:
+        if not _INT32_MIN <= value <= _INT32_MAX:
+            raise ValueError('weight out of range ({})'.format(value))
+
+
+def encode_weight(values):
+    check_weight(values)
+    count = len(values)
+    nonzero = [(index, value) for index, value in enumerate(values) if value]
+
+    # sparse: 6 bytes per non-zero column, dense: 4 bytes per column
+    if len(nonzero) * 6 < count * 4:
+        flat = [item for pair in nonzero for item in pair]
+        return _HEADER.pack(SPARSE, count) + struct.pack('<' + 'Hi' * len(nonzero), *flat)
+    return _HEADER.pack(DENSE, count) + struct.pack('<{}i'.format(count), *values)
+
+
+def weight_length(blob):
+    # number of columns, read from the header without unpacking the row
+    blob = bytes(blob[:_HEADER.size])
+    if not blob:
+        return 0
+    return _HEADER.unpack(blob)[1]
+
+
+def decode_weight(blob):
+    blob = bytes(blob)  # BinaryField may hand us a memoryview
+    if not blob:
+        return []
+
+    form, count = _HEADER.unpack_from(blob)
+    payload = blob[_HEADER.size:]
+
+    if form == DENSE:
+        return list(struct.unpack('<{}i'.format(count), payload))
+    if form == SPARSE:
+        values = [0] * count
+        for index, value in struct.iter_unpack('<Hi', payload):
+            values[index] = value
+        return values
+    raise ValueError('unknown weight format ({})'.format(form))
+
+
+# Whole table exchanged as application/octet-stream (see weight_table.renderers)
+#   header  : magic, number of rows, number of columns, number of deleted ids, cursor
+#   rows    : symbol id + columns int32 per row, shorter rows padded with zeros
+#   deleted : one int32 symbol id each (delta syncs only)
+_MATRIX_MAGIC = b'WTM1'
+_MATRIX_HEADER = struct.Struct('<4sIIIQ')
+
+
+def pack_weight_matrix(rows, cursor=0, deleted=()):
+    # rows: [(symbol_id, [weight, ...])]
+    columns = max((len(weight) for _, weight in rows), default=0)
+    matrix = numpy.zeros((len(rows), columns + 1), dtype='<i4')
+    for index, (symbol_id, weight) in enumerate(rows):
+        matrix[index, 0] = symbol_id
+        matrix[index, 1:len(weight) + 1] = weight
+
+    header = _MATRIX_HEADER.pack(_MATRIX_MAGIC, len(rows), columns, len(deleted), cursor)
+    return header + matrix.tobytes() + numpy.asarray(deleted, dtype='<i4').tobytes()
+
+
+def unpack_weight_matrix(data):
+    # returns (rows, cursor, deleted) as taken by pack_weight_matrix
+    if len(data) < _MATRIX_HEADER.size:
+        raise ValueError('truncated weight matrix')
+    magic, count, columns, deleted_count, cursor = _MATRIX_HEADER.unpack_from(data)
+    if magic != _MATRIX_MAGIC:
+        raise ValueError('not a weight matrix')
+    if len(data) != _MATRIX_HEADER.size + 4 * (count * (columns + 1) + deleted_count):
+        raise ValueError('weight matrix size does not match its header')
+
+    body = numpy.frombuffer(data, dtype='<i4', offset=_MATRIX_HEADER.size)
+    matrix = body[:count * (columns + 1)].reshape(count, columns + 1)
+    rows = [(int(row[0]), row[1:].tolist()) for row in matrix]
+    return rows, cursor, body[count * (columns + 1):].tolist()
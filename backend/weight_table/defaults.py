@@ -0,0 +1,147 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from functools import lru_cache
+
+from django.conf import settings
+
+from weight_table.codec import decode_weight, parse_weight
+
+logger = logging.getLogger(__name__)
+
+# Compiled default table (see the compile_weight_table command)
+#   header : magic, number of rows, number of columns
+#   body   : rows x columns int32, little-endian, row i holds symbol i + 1
+_MAGIC = b'WTB1'
+_HEADER = struct.Struct('<4sII')
+
+
+class DefaultWeightTable:
+    # Read-only view over a compiled table. When it is backed by an mmap every
+    # worker shares the same physical pages, and rows are sliced out of the
+    # buffer without parsing anything.
+
+    def __init__(self, buffer):
+        magic, self.rows, self.columns = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError('not a compiled weight table')
+
+        body = memoryview(buffer)[_HEADER.size:_HEADER.size + self.rows * self.columns * 4]
+        if sys.byteorder == 'little':
+            self._values = body.cast('i')
+        else:
+            self._values = struct.unpack('<{}i'.format(self.rows * self.columns), body)
+        self._buffer = buffer
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, symbol_id):
+        return 1 <= symbol_id <= self.rows
+
+    def __getitem__(self, symbol_id):
+        if symbol_id not in self:
+            raise KeyError(symbol_id)
+        start = (symbol_id - 1) * self.columns
+        return list(self._values[start:start + self.columns])
+
+    def get(self, symbol_id, default=None):
+        return self[symbol_id] if symbol_id in self else default
+
+    def symbol_ids(self):
+        return range(1, self.rows + 1)
+
+
+def _pack_default_weights(source):
+    with open(source, 'r') as file:
+        rows = [parse_weight(line) for line in file if line.strip()]
+    columns = max((len(row) for row in rows), default=0)
+
+    chunks = [_HEADER.pack(_MAGIC, len(rows), columns)]
+    for row in rows:
+        row = row + [0] * (columns - len(row))
+        chunks.append(struct.pack('<{}i'.format(columns), *row))
+    return b''.join(chunks)
+
+
+def compile_default_weights(source, target):
+    data = _pack_default_weights(source)
+
+    # Write next to the target and rename, so a worker never maps a half-written file
+    directory = os.path.dirname(os.path.abspath(target))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        # mkstemp creates the file owner-only; workers may run as another user
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return DefaultWeightTable(data)
+
+
+def _is_stale(source, target):
+    return not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source)
+
+
+# Every user starts from the same matrix (weight_table.txt, one row per default
+# symbol). Only rows that differ from it are stored in WeightTable, so the
+# default is mapped once per process and merged in on the way out. Workers only
+# read the artifact; compile_weight_table builds it (e.g. at deploy time).
+@lru_cache(maxsize=None)
+def load_default_weights():
+    source = settings.WEIGHT_TABLE_PATH
+    target = settings.WEIGHT_TABLE_ARTIFACT_PATH
+
+    if not _is_stale(source, target):
+        try:
+            with open(target, 'rb') as file:
+                return DefaultWeightTable(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError) as e:
+            logger.warning('Cannot map %s (%s), using a private copy of the default weights', target, e)
+    else:
+        logger.warning('%s is missing or older than %s, run compile_weight_table; '
+                       'using a private copy of the default weights', target, source)
+
+    return DefaultWeightTable(_pack_default_weights(source))
+
+
+def matches_default(symbol_id, values):
+    default = load_default_weights().get(symbol_id)
+    if default is None:
+        return False
+
+    # Columns past the default width belong to user-created symbols,
+    # so the row is still the default as long as those are all zero
+    width = len(default)
+    return values[:width] == default and not any(values[width:])
+
+
+def pad_default(default, width):
+    # Default rows of a restored table are padded to the widest override of the
+    # user, by every reader (full, streamed and delta)
+    return default + [0] * (width - len(default))
+
+
+def merge_with_defaults(rows):
+    # rows: {symbol_id: packed or decoded weight} overrides of a single user
+    # returns [(symbol_id, weight)] for the whole table, sorted by symbol_id
+    overrides = {
+        symbol_id: decode_weight(weight) if isinstance(weight, (bytes, memoryview)) else weight
+        for symbol_id, weight in rows.items()
+    }
+    default_weights = load_default_weights()
+
+    width = max((len(weight) for weight in overrides.values()), default=0)
+    merged = dict(overrides)
+    for symbol_id in default_weights.symbol_ids():
+        if symbol_id not in merged:
+            merged[symbol_id] = pad_default(default_weights[symbol_id], width)
+
+    return sorted(merged.items())
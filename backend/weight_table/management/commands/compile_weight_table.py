@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from weight_table.defaults import compile_default_weights, load_default_weights
+
+
+class Command(BaseCommand):
+    help = 'Compile the default weight table (WEIGHT_TABLE_PATH) into the binary artifact workers memory-map'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=settings.WEIGHT_TABLE_PATH)
+        parser.add_argument('--output', default=settings.WEIGHT_TABLE_ARTIFACT_PATH)
+
+    def handle(self, *args, **options):
+        table = compile_default_weights(options['source'], options['output'])
+        load_default_weights.cache_clear()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Compiled {} rows x {} columns into {}'.format(table.rows, table.columns, options['output'])
+        ))
@@ -0,0 +1,28 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from weight_table.models import WeightUploadSession
+
+BATCH_SIZE = 1000
+
+
+# Meant to run periodically (e.g. from cron): python manage.py purge_weight_uploads
+class Command(BaseCommand):
+    help = 'Delete chunked weight table uploads (and their chunks) older than WEIGHT_UPLOAD_EXPIRES'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.WEIGHT_UPLOAD_EXPIRES)
+        expired = WeightUploadSession.objects.filter(created_at__lt=cutoff)
+
+        deleted = 0
+        while True:
+            ids = list(expired.values_list('id', flat=True)[:BATCH_SIZE])
+            if not ids:
+                break
+            WeightUploadSession.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+
+        self.stdout.write('weight_uploads_deleted={}'.format(deleted))
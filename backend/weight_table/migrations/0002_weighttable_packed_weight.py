@@ -0,0 +1,24 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weight_table', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weighttable',
+            name='packed_weight',
+            field=models.BinaryField(default=b''),
+        ),
+        # keeps 0004 reversible (the text column is re-added with this default)
+        migrations.AlterField(
+            model_name='weighttable',
+            name='weight',
+            field=models.TextField(default=''),
+        ),
+    ]
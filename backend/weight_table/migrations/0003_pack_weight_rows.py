@@ -0,0 +1,45 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:01
+
+from django.db import migrations
+
+from weight_table.codec import decode_weight, encode_weight, format_weight, parse_weight
+
+BATCH_SIZE = 500
+
+
+def batches(WeightTable, *fields):
+    # walk the table by primary key so no cursor stays open while rows are written
+    last_id = 0
+    while True:
+        rows = list(WeightTable.objects.filter(id__gt=last_id).order_by('id').only('id', *fields)[:BATCH_SIZE])
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield rows
+
+
+def pack_weight_rows(apps, schema_editor):
+    WeightTable = apps.get_model('weight_table', 'WeightTable')
+    for rows in batches(WeightTable, 'weight'):
+        for row in rows:
+            row.packed_weight = encode_weight(parse_weight(row.weight))
+        WeightTable.objects.bulk_update(rows, ['packed_weight'])
+
+
+def unpack_weight_rows(apps, schema_editor):
+    WeightTable = apps.get_model('weight_table', 'WeightTable')
+    for rows in batches(WeightTable, 'packed_weight'):
+        for row in rows:
+            row.weight = format_weight(decode_weight(row.packed_weight))
+        WeightTable.objects.bulk_update(rows, ['weight'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weight_table', '0002_weighttable_packed_weight'),
+    ]
+
+    operations = [
+        migrations.RunPython(pack_weight_rows, unpack_weight_rows),
+    ]
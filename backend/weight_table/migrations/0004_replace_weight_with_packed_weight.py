@@ -0,0 +1,27 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weight_table', '0003_pack_weight_rows'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='weighttable',
+            name='weight',
+        ),
+        migrations.RenameField(
+            model_name='weighttable',
+            old_name='packed_weight',
+            new_name='weight',
+        ),
+        migrations.AlterField(
+            model_name='weighttable',
+            name='weight',
+            field=models.BinaryField(),
+        ),
+    ]
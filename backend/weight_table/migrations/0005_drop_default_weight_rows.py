@@ -0,0 +1,36 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:00
+
+from django.db import migrations
+
+from weight_table.codec import decode_weight
+from weight_table.defaults import matches_default
+
+BATCH_SIZE = 500
+
+
+# Rows seeded at signup that still equal the shared default are redundant now
+# that the default is merged in on read
+def drop_default_weight_rows(apps, schema_editor):
+    WeightTable = apps.get_model('weight_table', 'WeightTable')
+    last_id = 0
+    while True:
+        rows = list(
+            WeightTable.objects.filter(id__gt=last_id).order_by('id').only('id', 'symbol_id', 'weight')[:BATCH_SIZE]
+        )
+        if not rows:
+            return
+        last_id = rows[-1].id
+
+        to_delete = [row.id for row in rows if matches_default(row.symbol_id, decode_weight(row.weight))]
+        WeightTable.objects.filter(id__in=to_delete).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weight_table', '0004_replace_weight_with_packed_weight'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_default_weight_rows, migrations.RunPython.noop),
+    ]
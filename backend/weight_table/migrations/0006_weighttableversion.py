@@ -0,0 +1,25 @@
+# Generated by Django 4.2.5 on 2026-10-18 09:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('weight_table', '0005_drop_default_weight_rows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeightTableVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='weight_table_version', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.5 on 2026-10-18 12:00
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+BATCH_SIZE = 500
+
+
+# Concurrent uploads could leave several rows for one (user, symbol_id);
+# keep the newest one so the unique constraint in 0008 can be added
+def dedupe_weight_rows(apps, schema_editor):
+    WeightTable = apps.get_model('weight_table', 'WeightTable')
+    duplicates = list(
+        WeightTable.objects.values('user_id', 'symbol_id')
+        .annotate(rows=Count('id'), keep=Max('id'))
+        .filter(rows__gt=1)
+        .values_list('user_id', 'symbol_id', 'keep')
+    )
+    for start in range(0, len(duplicates), BATCH_SIZE):
+        to_delete = []
+        for user_id, symbol_id, keep in duplicates[start:start + BATCH_SIZE]:
+            to_delete.extend(
+                WeightTable.objects.filter(user_id=user_id, symbol_id=symbol_id)
+                .exclude(id=keep)
+                .values_list('id', flat=True)
+            )
+        WeightTable.objects.filter(id__in=to_delete).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weight_table', '0006_weighttableversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_weight_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weight_table', '0007_dedupe_weight_rows'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='weighttable',
+            constraint=models.UniqueConstraint(fields=('user', 'symbol_id'), name='unique_weight_row_per_user'),
+        ),
+    ]
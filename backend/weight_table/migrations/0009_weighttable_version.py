@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weight_table', '0008_weighttable_unique_weight_row_per_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weighttable',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
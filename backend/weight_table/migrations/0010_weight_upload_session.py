@@ -0,0 +1,38 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('weight_table', '0009_weighttable_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeightUploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weight_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WeightUploadChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.IntegerField()),
+                ('rows', models.JSONField()),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='weight_table.weightuploadsession')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='weightuploadchunk',
+            constraint=models.UniqueConstraint(fields=('session', 'number'), name='unique_weight_upload_chunk'),
+        ),
+    ]
@@ -1,10 +1,79 @@
-from django.db import models
+from django.db import connections, models
+from django.utils import timezone
 
 
 # Create your models here.
 
+class WeightTableManager(models.Manager):
+
+    # Insert rows or overwrite the weight of existing (user, symbol_id) rows in bulk
+    def upsert(self, rows, batch_size=500):
+        features = connections[self.db].features
+        if features.supports_update_conflicts:
+            # MySQL resolves conflicts on any unique key and rejects an explicit target
+            unique_fields = ['user', 'symbol_id'] if features.supports_update_conflicts_with_target else None
+            return self.bulk_create(
+                rows, batch_size=batch_size,
+                update_conflicts=True, unique_fields=unique_fields, update_fields=['weight', 'updated_at', 'version'],
+            )
+
+        existing = {
+            (user_id, symbol_id): id
+            for id, user_id, symbol_id in self.filter(
+                user_id__in={row.user_id for row in rows},
+                symbol_id__in={row.symbol_id for row in rows},
+            ).values_list('id', 'user_id', 'symbol_id')
+        }
+        to_update = []
+        to_create = []
+        for row in rows:
+            row.id = existing.get((row.user_id, row.symbol_id))
+            row.updated_at = timezone.now()
+            (to_create if row.id is None else to_update).append(row)
+        self.bulk_update(to_update, ['weight', 'updated_at', 'version'], batch_size=batch_size)
+        self.bulk_create(to_create, batch_size=batch_size)
+        return rows
+
+
 class WeightTable(models.Model):
+    objects = WeightTableManager()
+
     symbol_id = models.IntegerField(null=False, blank=False)
-    weight = models.TextField(null=False, blank=False)
+    # packed with weight_table.codec (see encode_weight / decode_weight)
+    weight = models.BinaryField(null=False, blank=False)
     user = models.ForeignKey('user.User', related_name='weight_table', on_delete=models.CASCADE)
     updated_at = models.DateTimeField(auto_now=True)
+    version = models.BigIntegerField(default=0)  # WeightTableVersion of the last change (see backup.sync)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'symbol_id'], name='unique_weight_row_per_user'),
+        ]
+
+
+# Bumped on every write to a user's weight table; serializes concurrent writers
+# (rows are locked with select_for_update) and tells clients which state they hold
+class WeightTableVersion(models.Model):
+    user = models.OneToOneField('user.User', related_name='weight_table_version', on_delete=models.CASCADE)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+# Weight table backup sent in numbered chunks over several requests (see
+# WeightUploadView); the commit applies the staged rows together, the same way
+# as a single POST to /weight/backup/
+class WeightUploadSession(models.Model):
+    user = models.ForeignKey('user.User', related_name='weight_uploads', on_delete=models.CASCADE)
+    version = models.BigIntegerField(null=True)  # WeightTableVersion of the commit, once committed
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class WeightUploadChunk(models.Model):
+    session = models.ForeignKey('WeightUploadSession', related_name='chunks', on_delete=models.CASCADE)
+    number = models.IntegerField()
+    rows = models.JSONField()  # [{"id", "weight"}] as received
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'number'], name='unique_weight_upload_chunk'),
+        ]
@@ -0,0 +1,28 @@
+import msgpack
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from weight_table.codec import unpack_weight_matrix
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read() if stream else b'', raw=False)
+        except ValueError as e:
+            raise ParseError('MessagePack parse error - {}'.format(e))
+
+
+# Body of a weight table backup as one int32 matrix; parsed into the same
+# {"weight_table": [{"id", "weight"}]} data as the JSON body
+class WeightMatrixParser(BaseParser):
+    media_type = 'application/octet-stream'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            rows, _, _ = unpack_weight_matrix(stream.read() if stream else b'')
+        except ValueError as e:
+            raise ParseError('Weight matrix parse error - {}'.format(e))
+        return {'weight_table': [{'id': symbol_id, 'weight': weight} for symbol_id, weight in rows]}
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from weight_table.defaults import merge_with_defaults
+from weight_table.models import WeightTable, WeightTableVersion
+
+
+class WeightMatrixCache:
+    # Per-process LRU of decoded weight matrices, keyed by user id.
+    # Each entry remembers the version it was built from, so a write handled
+    # by another worker is noticed on the next lookup.
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, version, matrix):
+        with self._lock:
+            self._entries[user_id] = (version, matrix)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+matrix_cache = WeightMatrixCache(settings.WEIGHT_MATRIX_CACHE_SIZE)
+
+
+def _matrix_version(user):
+    # every write bumps WeightTableVersion, so one unique-key lookup tells us if the entry is stale
+    return WeightTableVersion.objects.filter(user=user).values_list('version', flat=True).first() or 0
+
+
+def build_weight_matrix(user):
+    overrides = dict(WeightTable.objects.filter(user=user).values_list('symbol_id', 'weight'))
+    rows = merge_with_defaults(overrides)
+
+    symbol_ids = np.array([symbol_id for symbol_id, _ in rows], dtype=np.int64)
+    width = max((len(weight) for _, weight in rows), default=0)
+    matrix = np.zeros((len(rows), width), dtype=np.int32)
+    for index, (_, weight) in enumerate(rows):
+        matrix[index, :len(weight)] = weight
+    return symbol_ids, matrix
+
+
+def get_weight_matrix(user):
+    version = _matrix_version(user)
+    matrix = matrix_cache.get(user.id, version)
+    if matrix is None:
+        matrix = build_weight_matrix(user)
+        matrix_cache.set(user.id, version, matrix)
+    return matrix
+
+
+def predict_next_symbols(user, after, k):
+    # Column j of a row counts how often the j-th symbol (ordered by id)
+    # followed the row's symbol, the same layout the app uses
+    symbol_ids, matrix = get_weight_matrix(user)
+
+    row_index = np.searchsorted(symbol_ids, after)
+    if row_index >= len(symbol_ids) or symbol_ids[row_index] != after:
+        return None
+
+    columns = min(matrix.shape[1], len(symbol_ids))
+    row = matrix[row_index, :columns]
+
+    # Only symbols that followed it; heaviest first, lower symbol id (column) first on ties
+    candidates = np.flatnonzero(row > 0)
+    top = candidates[np.lexsort((candidates, -row[candidates]))][:k]
+    return [(int(symbol_ids[index]), int(row[index])) for index in top]
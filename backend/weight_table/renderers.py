@@ -0,0 +1,41 @@
+import msgpack
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from weight_table.codec import pack_weight_matrix
+
+
+# Binary formats of the weight endpoints, picked by the Accept header. Rows are
+# plain int lists here instead of the "[0,0,...]" strings of the JSON format.
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True)
+
+
+# The weight table as one int32 matrix (weight_table.codec.pack_weight_matrix)
+class WeightMatrixRenderer(BaseRenderer):
+    media_type = 'application/octet-stream'
+    format = 'matrix'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        if not isinstance(data, dict) or 'weight_table' not in data:
+            # Errors and write results are not a matrix; they are answered in JSON
+            response = (renderer_context or {}).get('response')
+            if response is not None:
+                response['Content-Type'] = JSONRenderer.media_type
+            return JSONRenderer().render(data, renderer_context=renderer_context)
+
+        rows = [(row['id'], row['weight']) for row in data['weight_table']]
+        return pack_weight_matrix(rows, data.get('cursor', 0), data.get('deleted', ()))
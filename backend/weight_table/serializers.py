@@ -1,39 +1,121 @@
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from entry.models import Symbol
+from backup.manifest import update_manifest, weight_row
+from backup.sync import record_tombstones
+from backup.versions import WEIGHTS
+from entry.serializers import SymbolListSerializer, SymbolValidationMixin
+from weight_table.codec import check_weight, decode_weight, encode_weight, format_weight, parse_weight
+from weight_table.defaults import load_default_weights, matches_default
 from weight_table.models import WeightTable
 
 
-class WeightTableBackupSerializer(serializers.Serializer):
+# The app exchanges rows as "[0,0,...]" strings while the DB keeps them packed.
+# Validated data carries the row as a list of ints.
+class WeightField(serializers.CharField):
+
+    def to_internal_value(self, data):
+        try:
+            # The binary formats (weight_table.parsers) already carry a list of ints
+            if isinstance(data, list):
+                if not all(isinstance(value, int) and not isinstance(value, bool) for value in data):
+                    raise ValueError('not an integer')
+                values = data
+            else:
+                values = parse_weight(super().to_internal_value(data))
+            check_weight(values)
+        except ValueError:
+            raise ValidationError(["Invalid weight (expected a list of integers)"])
+        return values
+
+    def to_representation(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            value = decode_weight(value)
+        return format_weight(value)
+
+
+# Saving replaces the user's whole table: one upsert for the rows that differ
+# from the default and changed, and one delete for everything else (rows equal
+# to the default and rows of symbols the user deleted). Written rows and
+# tombstones are stamped with `version`, the table's new WeightTableVersion.
+# `changed` tells whether any row was written or deleted.
+class WeightTableListSerializer(SymbolListSerializer):
+
+    def save(self, version, **kwargs):
+        self.version = version
+        self.changed = False
+        return super().save(**kwargs)
+
+    def create(self, validated_data):
+        user = self.context['user']
+
+        weights = {item['symbol_id']: item['weight'] for item in validated_data}
+        packed = {
+            symbol_id: encode_weight(weight)
+            for symbol_id, weight in weights.items()
+            if not matches_default(symbol_id, weight)
+        }
+
+        with transaction.atomic():
+            stored = dict(WeightTable.objects.filter(user=user).values_list('symbol_id', 'weight'))
+            removed = set(stored) - set(packed)
+            rows = [
+                WeightTable(user=user, symbol_id=symbol_id, weight=weight, version=self.version)
+                for symbol_id, weight in packed.items()
+                if symbol_id not in stored or bytes(stored[symbol_id]) != weight
+            ]
+            if not rows and not removed:
+                return rows
+            self.changed = True
+
+            WeightTable.objects.filter(user=user, symbol_id__in=removed).delete()
+            WeightTable.objects.upsert(rows)
+            record_tombstones(user, WEIGHTS, removed, self.version)
+
+            # Rows that were an override or go back to the default change in the
+            # full table; a removed row without a default leaves it
+            default_weights = load_default_weights()
+            changed = removed | {row.symbol_id for row in rows}
+            before = {symbol_id: decode_weight(stored[symbol_id]) if symbol_id in stored
+                      else default_weights.get(symbol_id) for symbol_id in changed}
+            after = {symbol_id: weights[symbol_id] if symbol_id in packed
+                     else default_weights.get(symbol_id) for symbol_id in changed}
+            update_manifest(
+                user, WEIGHTS, self.version,
+                added=[weight_row(symbol_id, weight) for symbol_id, weight in after.items() if weight is not None],
+                removed=[weight_row(symbol_id, weight) for symbol_id, weight in before.items() if weight is not None],
+            )
+
+        return rows
+
+
+class WeightTableBackupSerializer(SymbolValidationMixin, serializers.Serializer):
     # symbol_id
     id = serializers.IntegerField(source='symbol_id', required=True)
-    weight = serializers.CharField(required=True)
+    weight = WeightField(required=True)
+
+    class Meta:
+        list_serializer_class = WeightTableListSerializer
 
     def validate(self, data):
-        id = data.get('symbol_id')
-        user = self.context['user']
+        self.validate_symbol(data.get('symbol_id'))
+        return data
 
-        all_symbols = list(Symbol.objects.values_list('id', flat=True))
-        if id not in all_symbols:
-            raise ValidationError({"id": ["Invalid symbol (no such symbol)"]})
 
-        # Default symbol이 아니라면
-        if id > 500:
-            symbol = Symbol.objects.get(id=id)
-            if symbol.created_by != user:
-                raise ValidationError({"not_mine": ["the requested symbol is created by another user"]})
+# One tap on the device: the count of `to_symbol` following `from_symbol` changes by `delta`
+class WeightIncrementSerializer(serializers.Serializer):
+    from_symbol = serializers.IntegerField(required=True)
+    to_symbol = serializers.IntegerField(required=True)
+    delta = serializers.IntegerField(required=True, min_value=-1000000, max_value=1000000)
 
-        return data
 
-    def create(self, validated_data):
-        user = self.context['user']
-        symbol_id = validated_data.get('symbol_id')
-        weight = validated_data.get('weight')
-
-        if not WeightTable.objects.filter(user=user, symbol_id=symbol_id).exists():
-            WeightTable.objects.create(user=user, symbol_id=symbol_id, weight=weight)
-        else:
-            weight_row = WeightTable.objects.get(user=user, symbol_id=symbol_id)
-            weight_row.weight = weight
-            weight_row.save()
+class WeightPredictSerializer(serializers.Serializer):
+    after = serializers.IntegerField(required=True)
+    k = serializers.IntegerField(required=False, default=10, min_value=1, max_value=100)
+
+
+class WeightUploadCommitSerializer(serializers.Serializer):
+    # number of chunks sent, numbered from 1
+    chunks = serializers.IntegerField(required=True, min_value=1, max_value=settings.WEIGHT_UPLOAD_MAX_CHUNKS)
@@ -0,0 +1,99 @@
+import re
+import zlib
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+from backup.versions import WEIGHTS, get_section_version
+from weight_table.codec import decode_weight, format_weight, weight_length
+from weight_table.defaults import load_default_weights, pad_default
+from weight_table.models import WeightTable
+
+_ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+def merged_rows(user, chunk_size):
+    # Same rows as merge_with_defaults, but the user's overrides are read in
+    # chunks and merged with the (memory-mapped) default table in id order
+    overrides = WeightTable.objects.filter(user=user).order_by('symbol_id')
+    default_weights = load_default_weights()
+
+    # Default rows are padded to the widest override; the headers tell the width
+    width = 0
+    for weight in overrides.values_list('weight', flat=True).iterator(chunk_size=chunk_size):
+        width = max(width, weight_length(weight))
+
+    def default_row(symbol_id):
+        return pad_default(default_weights[symbol_id], width)
+
+    default_ids = iter(default_weights.symbol_ids())
+    next_default = next(default_ids, None)
+    for symbol_id, weight in overrides.values_list('symbol_id', 'weight').iterator(chunk_size=chunk_size):
+        while next_default is not None and next_default < symbol_id:
+            yield next_default, default_row(next_default)
+            next_default = next(default_ids, None)
+        if next_default == symbol_id:
+            next_default = next(default_ids, None)
+        yield symbol_id, decode_weight(weight)
+
+    while next_default is not None:
+        yield next_default, default_row(next_default)
+        next_default = next(default_ids, None)
+
+
+def _repeatable_read():
+    # First statement of a new transaction: its reads then all see the same
+    # snapshot (SQLite transactions always do)
+    if connection.vendor in ('postgresql', 'mysql'):
+        with connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+
+
+def stream_weight_table(user, chunk_size=None):
+    # The JSON of get_weight_table(user), chunk_size rows at a time. The cursor,
+    # the width pass of merged_rows and the rows are read in one snapshot, so a
+    # write committed meanwhile does not show up in some of them only.
+    chunk_size = chunk_size or settings.WEIGHT_STREAM_CHUNK_SIZE
+
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost:
+            _repeatable_read()
+        cursor = get_section_version(user, WEIGHTS)
+
+        yield '{"weight_table":['
+        batch = []
+        for index, (symbol_id, weight) in enumerate(merged_rows(user, chunk_size)):
+            batch.append('{}{{"id":{},"weight":"{}"}}'.format(',' if index else '', symbol_id, format_weight(weight)))
+            if len(batch) == chunk_size:
+                yield ''.join(batch)
+                batch = []
+        yield ''.join(batch) + '],"cursor":{}}}'.format(cursor)
+
+
+def gzip_chunks(chunks):
+    # Every chunk is flushed, so the client can inflate it as soon as it arrives
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def accepts_gzip(request):
+    return bool(_ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+
+def weight_table_streaming_response(request):
+    chunks = stream_weight_table(request.user)
+
+    # The gzip body is another entity than the plain one: weight_table_etag
+    # gives it its own ETag
+    if accepts_gzip(request):
+        response = StreamingHttpResponse(gzip_chunks(chunks), content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(chunks, content_type='application/json')
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -1,3 +1,577 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import mmap
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+
+from entry.models import Symbol
+from user.models import User
+from weight_table.codec import DENSE, SPARSE, decode_weight, encode_weight, format_weight, pack_weight_matrix, \
+    parse_weight, unpack_weight_matrix
+from weight_table.defaults import DefaultWeightTable, load_default_weights
+from weight_table.models import WeightTable, WeightTableVersion, WeightUploadSession
+from weight_table.prediction import matrix_cache
+
+
+class WeightCodecTest(TestCase):
+
+    def test_sparse_round_trip(self):
+        values = [0] * 500
+        values[3] = 10
+        values[499] = -2
+        blob = encode_weight(values)
+        self.assertEqual(blob[0], SPARSE)
+        self.assertEqual(len(blob), 3 + 2 * 6)
+        self.assertEqual(decode_weight(blob), values)
+
+    def test_dense_round_trip(self):
+        values = list(range(1, 501))
+        blob = encode_weight(values)
+        self.assertEqual(blob[0], DENSE)
+        self.assertEqual(len(blob), 3 + 500 * 4)
+        self.assertEqual(decode_weight(memoryview(blob)), values)
+
+    def test_text_format(self):
+        # rows seeded from weight_table.txt keep the trailing newline
+        self.assertEqual(parse_weight('[0,10,0\n]'), [0, 10, 0])
+        self.assertEqual(parse_weight('[]'), [])
+        self.assertEqual(format_weight([0, 10, 0]), '[0,10,0]')
+
+    def test_matrix_round_trip(self):
+        rows = [(1, [0, 10, 0]), (2, [20]), (501, [])]
+        data = pack_weight_matrix(rows, cursor=7, deleted=[502])
+        self.assertEqual(unpack_weight_matrix(data), ([(1, [0, 10, 0]), (2, [20, 0, 0]), (501, [0, 0, 0])], 7, [502]))
+        with self.assertRaises(ValueError):
+            unpack_weight_matrix(data[:-1])
+
+
+class DefaultWeightTableTest(TestCase):
+
+    def test_compile_weight_table(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'weight_table.bin')
+            call_command('compile_weight_table', output=output, stdout=StringIO())
+
+            with open(output, 'rb') as file:
+                table = DefaultWeightTable(file.read())
+
+        with open(settings.WEIGHT_TABLE_PATH, 'r') as file:
+            lines = file.readlines()
+        self.assertEqual(len(table), len(lines))
+        self.assertEqual(table[1], parse_weight(lines[0]))
+        self.assertEqual(table[len(lines)], parse_weight(lines[-1]))
+        self.assertIsNone(table.get(len(lines) + 1))
+
+    def test_default_weight_table_is_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'weight_table.bin')
+            call_command('compile_weight_table', output=output, stdout=StringIO())
+            self.assertEqual(os.stat(output).st_mode & 0o777, 0o644)  # readable by workers of other users
+
+            load_default_weights.cache_clear()
+            self.addCleanup(load_default_weights.cache_clear)
+            with override_settings(WEIGHT_TABLE_ARTIFACT_PATH=output):
+                self.assertIsInstance(load_default_weights()._buffer, mmap.mmap)
+
+    def test_default_weight_table_without_usable_artifact(self):
+        self.addCleanup(load_default_weights.cache_clear)
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'weight_table.bin')
+            for content in [None, b'']:  # missing (never compiled), broken
+                if content is not None:
+                    with open(output, 'wb') as file:
+                        file.write(content)
+                load_default_weights.cache_clear()
+                with override_settings(WEIGHT_TABLE_ARTIFACT_PATH=output), \
+                        self.assertLogs('weight_table.defaults', 'WARNING'):
+                    table = load_default_weights()
+                self.assertIsInstance(table._buffer, bytes)
+                self.assertGreater(len(table), 0)
+            self.assertEqual(os.listdir(directory), ['weight_table.bin'])  # not written by the worker
+
+
+class WeightTableTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test_email@gmail.com',
+            password='test_password',
+            nickname='test_nickname'
+        )
+        self.tokens = self.login_and_get_tokens()
+        self.access_token = self.tokens.get('access')
+        self.refresh_token = self.tokens.get('refresh')
+
+        Symbol.objects.create(id=1, text="default1", category=1)
+        Symbol.objects.create(id=2, text="default2", category=1)
+        matrix_cache.clear()
+
+    def login_and_get_tokens(self):
+        data = {
+            'email': 'test_email@gmail.com',
+            'password': 'test_password',
+        }
+        response = self.client.post('/user/login/', data)
+        if response.status_code == status.HTTP_200_OK:
+            tokens = response.json()
+            return tokens
+        return None
+
+    def test_weight_table_backup_success(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        data = {
+            'weight_table': [
+                {'id': 1, 'weight': '[0,10,0]'},
+                {'id': 2, 'weight': '[20,0,0]'},
+            ]
+        }
+        response = self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        row = WeightTable.objects.get(user=self.user, symbol_id=1)
+        self.assertEqual(decode_weight(row.weight), [0, 10, 0])
+
+        response = self.client.get('/weight/backup/', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json().get('weight_table')[:2], data['weight_table'])
+
+    def test_get_default_weight_table_success(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        response = self.client.get('/weight/backup/', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        weight_table = response.json().get('weight_table')
+        self.assertEqual(len(weight_table), len(load_default_weights()))
+        self.assertEqual(weight_table[0]['id'], 1)
+        self.assertEqual(parse_weight(weight_table[0]['weight']), load_default_weights()[1])
+
+    def test_weight_table_backup_stores_only_overrides(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        default = load_default_weights()
+        changed = list(default[2])
+        changed[0] += 10
+        data = {
+            'weight_table': [
+                {'id': 1, 'weight': format_weight(default[1] + [0])},  # default + one column for a custom symbol
+                {'id': 2, 'weight': format_weight(changed + [0])},
+            ]
+        }
+        response = self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(WeightTable.objects.filter(user=self.user).values_list('symbol_id', flat=True)), [2])
+
+        response = self.client.get('/weight/backup/', **headers)
+        weight_table = response.json().get('weight_table')
+        self.assertEqual(weight_table[:2], data['weight_table'])
+
+    def test_get_weight_table_not_modified(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        etag = self.client.get('/weight/backup/', **headers)['ETag']
+        response = self.client.get('/weight/backup/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        data = {
+            'increments': [
+                {'from_symbol': 1, 'to_symbol': 2, 'delta': 1},
+            ]
+        }
+        self.client.post('/weight/increment/', data, content_type='application/json', **headers)
+        response = self.client.get('/weight/backup/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_same_weight_table_keeps_version(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        data = {'weight_table': [{'id': 1, 'weight': '[0,10,0]'}]}
+        response = self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+        self.assertEqual(response.json()['version'], 1)
+        etag = self.client.get('/weight/backup/', **headers)['ETag']
+
+        response = self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+        self.assertEqual(response.json()['version'], 1)
+        response = self.client.get('/weight/backup/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_get_weight_table_since_cursor(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        data = {
+            'weight_table': [
+                {'id': 1, 'weight': '[0,10,0]'},
+                {'id': 2, 'weight': '[20,0,0]'},
+            ]
+        }
+        self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+        cursor = self.client.get('/weight/backup/', **headers).json().get('cursor')
+        self.assertEqual(cursor, 1)
+
+        # only row 2 changes; row 1 is left out, so it is back to the default
+        data = {
+            'weight_table': [
+                {'id': 2, 'weight': '[30,0,0]'},
+            ]
+        }
+        self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+        response = self.client.get('/weight/backup/?since={}'.format(cursor), **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json().get('weight_table'), [
+            {'id': 1, 'weight': format_weight(load_default_weights()[1])},
+            {'id': 2, 'weight': '[30,0,0]'},
+        ])
+        self.assertEqual(response.json().get('deleted'), [])
+        self.assertEqual(response.json().get('cursor'), 2)
+
+        # a backup of the same table changes nothing
+        self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+        response = self.client.get('/weight/backup/?since=2', **headers)
+        self.assertEqual(response.json().get('weight_table'), [])
+
+    def test_delta_rows_padded_like_full_restore(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        Symbol.objects.create(id=501, text="mine", category=1, created_by=self.user)
+        wide = {'id': 501, 'weight': format_weight([1] * 501)}  # one column wider than the defaults
+        data = {'weight_table': [{'id': 1, 'weight': '[0,10,0]'}, wide]}
+        self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+
+        # row 1 goes back to the default
+        self.client.post('/weight/backup/', {'weight_table': [wide]}, content_type='application/json', **headers)
+        full = self.client.get('/weight/backup/', **headers).json().get('weight_table')
+        delta = self.client.get('/weight/backup/?since=1', **headers).json().get('weight_table')
+        self.assertEqual(delta, [full[0]])
+
+    def test_weight_writes_fail_not_an_object(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        body = msgpack.packb([{'id': 1, 'weight': [0, 10, 0]}])
+        for path in ['/weight/backup/', '/weight/increment/']:
+            response = self.client.post(path, body, content_type='application/msgpack', **headers)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        upload_id = self.client.post('/weight/upload/', **headers).json().get('upload_id')
+        response = self.client.put(f'/weight/upload/{upload_id}/1/', body, content_type='application/msgpack',
+                                   **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_weight_table_msgpack_format(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        data = {
+            'weight_table': [
+                {'id': 1, 'weight': [0, 10, 0]},
+            ]
+        }
+        response = self.client.post('/weight/backup/', msgpack.packb(data), content_type='application/msgpack',
+                                    HTTP_ACCEPT='application/msgpack', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(msgpack.unpackb(response.content), {'version': 1})
+
+        response = self.client.get('/weight/backup/', HTTP_ACCEPT='application/msgpack', **headers)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        weight_table = msgpack.unpackb(response.content)['weight_table']
+        self.assertEqual(weight_table[0], {'id': 1, 'weight': [0, 10, 0]})
+        self.assertEqual(weight_table[1], {'id': 2, 'weight': load_default_weights()[2]})
+
+        # JSON is still the default
+        response = self.client.get('/weight/backup/', **headers)
+        self.assertEqual(response.json().get('weight_table')[0], {'id': 1, 'weight': '[0,10,0]'})
+
+    def test_weight_table_matrix_format(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        body = pack_weight_matrix([(1, [0, 10, 0]), (2, [20, 0, 0])])
+        response = self.client.post('/weight/backup/', body, content_type='application/octet-stream', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(decode_weight(WeightTable.objects.get(user=self.user, symbol_id=2).weight), [20, 0, 0])
+
+        response = self.client.get('/weight/backup/', HTTP_ACCEPT='application/octet-stream', **headers)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertIn('Accept', response['Vary'])
+        rows, cursor, deleted = unpack_weight_matrix(response.content)
+        self.assertEqual(len(rows), len(load_default_weights()))
+        self.assertEqual(rows[0], (1, [0, 10, 0] + [0] * (len(load_default_weights()[1]) - 3)))
+        self.assertEqual((cursor, deleted), (1, []))
+
+        # errors are not a matrix
+        response = self.client.get('/weight/backup/?since=99', HTTP_ACCEPT='application/octet-stream', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('since', response.json()['error']['message'])
+
+    def test_weight_table_backup_fail_broken_matrix(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        body = pack_weight_matrix([(1, [0, 10, 0])])[:-2]
+        response = self.client.post('/weight/backup/', body, content_type='application/octet-stream', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(WEIGHT_STREAM_CHUNK_SIZE=100)
+    def test_get_weight_table_streaming(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        data = {
+            'weight_table': [
+                {'id': 2, 'weight': '[0,10,0]'},
+                {'id': 501, 'weight': format_weight([1] * 501)},  # a user symbol, one column wider
+            ]
+        }
+        Symbol.objects.create(id=501, text="mine", category=1, created_by=self.user)
+        response = self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = self.client.get('/weight/backup/', **headers).json()
+        self.assertEqual(expected['weight_table'][-1]['id'], 501)
+
+        response = self.client.get('/weight/backup/?stream=1', **headers)
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), len(load_default_weights()) // 100)
+        self.assertEqual(json.loads(b''.join(chunks)), expected)
+
+        response = self.client.get('/weight/backup/?stream=1', HTTP_ACCEPT_ENCODING='gzip', **headers)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(b''.join(response.streaming_content))), expected)
+
+        self.assertIn('Accept', response['Vary'])
+
+        # the gzip body has its own ETag
+        etag = response['ETag']
+        self.assertNotEqual(etag, self.client.get('/weight/backup/?stream=1', **headers)['ETag'])
+        response = self.client.get('/weight/backup/?stream=1', HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_weight_table_backup_fail_invalid_weight(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        data = {
+            'weight_table': [
+                {'id': 1, 'weight': '[0,ten,0]'},
+            ]
+        }
+        response = self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_predict_next_symbols_success(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        weights = [0] * 500
+        weights[2] = 30  # symbol 3
+        weights[4] = 20  # symbol 5
+        data = {
+            'weight_table': [
+                {'id': 1, 'weight': format_weight(weights)},
+            ]
+        }
+        self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+
+        response = self.client.get('/weight/predict/?after=1&k=2', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json().get('results'), [{'id': 3, 'weight': 30}, {'id': 5, 'weight': 20}])
+
+        # a new backup replaces the cached matrix
+        weights[4] = 40
+        data['weight_table'][0]['weight'] = format_weight(weights)
+        self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+
+        response = self.client.get('/weight/predict/?after=1&k=1', **headers)
+        self.assertEqual(response.json().get('results'), [{'id': 5, 'weight': 40}])
+
+        # ties go to the lower id; symbols that never followed are left out
+        weights[100] = 40  # symbol 101
+        data['weight_table'][0]['weight'] = format_weight(weights)
+        self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+        response = self.client.get('/weight/predict/?after=1&k=5', **headers)
+        self.assertEqual(response.json().get('results'), [
+            {'id': 5, 'weight': 40}, {'id': 101, 'weight': 40}, {'id': 3, 'weight': 30},
+        ])
+
+    def test_predict_next_symbols_fail_no_such_symbol(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        response = self.client.get('/weight/predict/?after=9999', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_weight_increment_success(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        data = {
+            'increments': [
+                {'from_symbol': 1, 'to_symbol': 3, 'delta': 10},
+                {'from_symbol': 1, 'to_symbol': 3, 'delta': 10},
+                {'from_symbol': 2, 'to_symbol': 1, 'delta': 5},
+            ]
+        }
+        response = self.client.post('/weight/increment/', data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json().get('version'), 1)
+
+        row = decode_weight(WeightTable.objects.get(user=self.user, symbol_id=1).weight)
+        self.assertEqual(row[2], load_default_weights()[1][2] + 20)
+
+        # undoing the change brings the row back to the shared default
+        data = {
+            'increments': [
+                {'from_symbol': 2, 'to_symbol': 1, 'delta': -5},
+            ]
+        }
+        response = self.client.post('/weight/increment/', data, content_type='application/json', **headers)
+        self.assertEqual(response.json().get('version'), 2)
+        self.assertFalse(WeightTable.objects.filter(user=self.user, symbol_id=2).exists())
+
+    def test_weight_increment_fail_no_such_symbol(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        data = {
+            'increments': [
+                {'from_symbol': 1, 'to_symbol': 9999, 'delta': 10},
+            ]
+        }
+        response = self.client.post('/weight/increment/', data, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(WeightTable.objects.filter(user=self.user).exists())
+
+    def test_chunked_upload_success(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        response = self.client.post('/weight/upload/', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        upload_id = response.json().get('upload_id')
+
+        chunks = {
+            2: {'weight_table': [{'id': 2, 'weight': '[20,0,0]'}]},
+            1: {'weight_table': [{'id': 1, 'weight': '[0,10,0]'}]},
+        }
+        for number, data in chunks.items():
+            response = self.client.put(f'/weight/upload/{upload_id}/{number}/', data,
+                                       content_type='application/json', **headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(f'/weight/upload/{upload_id}/', **headers)
+        self.assertEqual(response.json().get('received'), [1, 2])
+
+        response = self.client.post(f'/weight/upload/{upload_id}/commit/', {'chunks': 3},
+                                    content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Missing chunks: 3', str(response.json()))
+
+        response = self.client.post(f'/weight/upload/{upload_id}/commit/', {'chunks': 2},
+                                    content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json().get('version'), 1)
+        self.assertEqual(decode_weight(WeightTable.objects.get(user=self.user, symbol_id=2).weight), [20, 0, 0])
+
+        # a retried commit is answered with the same version, without writing again
+        response = self.client.post(f'/weight/upload/{upload_id}/commit/', {'chunks': 2},
+                                    content_type='application/json', **headers)
+        self.assertEqual(response.json().get('version'), 1)
+        self.assertEqual(WeightTableVersion.objects.get(user=self.user).version, 1)
+
+    def test_chunked_upload_fail_invalid_rows(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        upload_id = self.client.post('/weight/upload/', **headers).json().get('upload_id')
+        data = {'weight_table': [{'id': 1, 'weight': '[0,ten,0]'}]}
+        self.client.put(f'/weight/upload/{upload_id}/1/', data, content_type='application/json', **headers)
+
+        # validated on commit, as a single POST would be
+        response = self.client.post(f'/weight/upload/{upload_id}/commit/', {'chunks': 1},
+                                    content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(WeightTable.objects.filter(user=self.user).exists())
+
+        # the bad chunk can be sent again
+        data = {'weight_table': [{'id': 1, 'weight': '[0,10,0]'}]}
+        self.client.put(f'/weight/upload/{upload_id}/1/', data, content_type='application/json', **headers)
+        response = self.client.post(f'/weight/upload/{upload_id}/commit/', {'chunks': 1},
+                                    content_type='application/json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_chunked_upload_fail_other_users_session(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        other_user = User.objects.create_user(
+            email='other_email@gmail.com',
+            password='other_password',
+            nickname='other_nickname'
+        )
+        session = WeightUploadSession.objects.create(user=other_user)
+        data = {'weight_table': []}
+        response = self.client.put(f'/weight/upload/{session.id}/1/', data, content_type='application/json',
+                                   **headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_purge_expired_weight_uploads(self):
+        old = WeightUploadSession.objects.create(user=self.user)
+        WeightUploadSession.objects.filter(id=old.id).update(
+            created_at=timezone.now() - datetime.timedelta(seconds=settings.WEIGHT_UPLOAD_EXPIRES + 1))
+        old.chunks.create(number=1, rows=[])
+        new = WeightUploadSession.objects.create(user=self.user)
+
+        out = StringIO()
+        call_command('purge_weight_uploads', stdout=out)
+        self.assertIn('weight_uploads_deleted=1', out.getvalue())
+        self.assertEqual(list(WeightUploadSession.objects.values_list('id', flat=True)), [new.id])
+
+    def test_weight_table_backup_overwrites_rows(self):
+        headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {self.access_token}'
+        }
+        for weight in ['[0,10,0]', '[0,20,0]']:
+            data = {
+                'weight_table': [
+                    {'id': 1, 'weight': weight},
+                ]
+            }
+            response = self.client.post('/weight/backup/', data, content_type='application/json', **headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        rows = WeightTable.objects.filter(user=self.user)
+        self.assertEqual(rows.count(), 1)
+        self.assertEqual(decode_weight(rows[0].weight), [0, 20, 0])
+
+    def test_weight_table_upsert_without_conflict_support(self):
+        WeightTable.objects.create(user=self.user, symbol_id=1, weight=encode_weight([1]))
+        rows = [
+            WeightTable(user=self.user, symbol_id=1, weight=encode_weight([2])),
+            WeightTable(user=self.user, symbol_id=2, weight=encode_weight([3])),
+        ]
+        with mock.patch.object(connection.features, 'supports_update_conflicts', False):
+            WeightTable.objects.upsert(rows)
+
+        weights = {row.symbol_id: decode_weight(row.weight) for row in WeightTable.objects.filter(user=self.user)}
+        self.assertEqual(weights, {1: [2], 2: [3]})
@@ -5,4 +5,10 @@ from . import views
 app_name = 'weight_table'
 urlpatterns = [
     path('backup/', views.WeightTableBackupView.as_view(), name='backup weight table'),
+    path('increment/', views.WeightIncrementView.as_view(), name='increment weight table'),
+    path('upload/', views.WeightUploadView.as_view(), name='start weight table upload'),
+    path('upload/<int:pk>/', views.WeightUploadSessionView.as_view(), name='get weight table upload'),
+    path('upload/<int:pk>/<int:number>/', views.WeightUploadChunkView.as_view(), name='put weight table chunk'),
+    path('upload/<int:pk>/commit/', views.WeightUploadCommitView.as_view(), name='commit weight table upload'),
+    path('predict/', views.WeightPredictView.as_view(), name='predict next symbols'),
 ]
\ No newline at end of file
@@ -1,42 +1,378 @@
+import datetime
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework import permissions, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from weight_table.models import WeightTable
-from weight_table.serializers import WeightTableBackupSerializer
+from backup.cache import cached_section, invalidate_section
+from backup.idempotency import idempotent
+from backup.locking import atomic_with_retry, lock_wait
+from backup.manifest import update_manifest, weight_row
+from backup.sync import check_cursor, deleted_since, parse_since, record_tombstones
+from backup.versions import WEIGHTS, get_section_version, section_etag
+from weight_table.codec import check_weight, decode_weight, encode_weight, weight_length
+from weight_table.defaults import load_default_weights, matches_default, merge_with_defaults, pad_default
+from weight_table.models import WeightTable, WeightTableVersion, WeightUploadChunk, WeightUploadSession
+from weight_table.parsers import MessagePackParser, WeightMatrixParser
+from weight_table.prediction import matrix_cache, predict_next_symbols
+from weight_table.renderers import MessagePackRenderer, WeightMatrixRenderer
+from weight_table.serializers import WeightTableBackupSerializer, WeightIncrementSerializer, \
+    WeightPredictSerializer, WeightUploadCommitSerializer
+from weight_table.streaming import accepts_gzip, weight_table_streaming_response
+
+
+# Must be called inside a transaction; concurrent writers of the same user wait here
+def lock_weight_table(user):
+    with lock_wait(WEIGHTS):
+        version, _ = WeightTableVersion.objects.select_for_update().get_or_create(user=user)
+    return version
+
+
+def bump_weight_table_version(user, version):
+    version.version += 1
+    version.save()
+    matrix_cache.invalidate(user.id)
+    invalidate_section(user.id, WEIGHTS)
+    return version.version
+
+
+# Section read/write shared by WeightTableBackupView and backup.views.BundleView
+
+def backup_weight_table(user, data):
+    serializer = WeightTableBackupSerializer(data=data, context={'user': user}, many=True)
+    serializer.is_valid(raise_exception=True)
+
+    def write():
+        version = lock_weight_table(user)
+        # Also deletes weight rows if user deleted corresponding symbols
+        serializer.save(version=version.version + 1)
+        if not serializer.changed:
+            return version.version  # the same table again: ETags and cached copies stay valid
+        return bump_weight_table_version(user, version)
+
+    return atomic_with_retry(WEIGHTS, write)
+
+
+@cached_section(WEIGHTS)
+def get_weight_table(user, since=None, binary=False):
+    # binary: rows as int lists for weight_table.renderers instead of "[0,0,...]" strings
+    cursor = get_section_version(user, WEIGHTS)
+    check_cursor(user, WEIGHTS, since, cursor)
+
+    if since is None:
+        # User rows only hold what differs from the default table
+        overrides = dict(WeightTable.objects.filter(user=user).values_list('symbol_id', 'weight'))
+        rows = merge_with_defaults(overrides)
+        deleted = []
+    else:
+        changed = {
+            symbol_id: decode_weight(weight)
+            for symbol_id, weight in WeightTable.objects.filter(user=user, version__gt=since)
+            .values_list('symbol_id', 'weight')
+        }
+        default_weights = load_default_weights()
+        deleted = []
+        reverted = []
+        for symbol_id in sorted(deleted_since(user, WEIGHTS, since) - set(changed)):
+            # A removed override means the row went back to the default
+            if symbol_id in default_weights:
+                reverted.append(symbol_id)
+            else:
+                deleted.append(symbol_id)
+        if reverted:
+            # as wide as in a full restore
+            width = max(map(weight_length, WeightTable.objects.filter(user=user).values_list('weight', flat=True)),
+                        default=0)
+            for symbol_id in reverted:
+                changed[symbol_id] = pad_default(default_weights[symbol_id], width)
+        rows = sorted(changed.items())
+
+    if binary:
+        response_data = [{'id': symbol_id, 'weight': weight} for symbol_id, weight in rows]
+    else:
+        weight_table = [{'symbol_id': symbol_id, 'weight': weight} for symbol_id, weight in rows]
+        response_data = WeightTableBackupSerializer(weight_table, many=True).data
+    response_data = {
+        "weight_table": response_data,
+        "cursor": cursor
+    }
+    if since is not None:
+        response_data["deleted"] = deleted
+    return response_data
+
+
+# Applies a WeightIncrementView batch
+def increment_weight_table(user, increments):
+    def write():
+        version = lock_weight_table(user)
+        new_version = version.version + 1
+
+        overrides = dict(WeightTable.objects.filter(user=user).values_list('symbol_id', 'weight'))
+        default_weights = load_default_weights()
+        # Columns follow the order of the rows (by symbol id), as on the device
+        symbol_ids = sorted(set(default_weights.symbol_ids()) | set(overrides))
+        width = max([default_weights.columns] + [weight_length(weight) for weight in overrides.values()])
+
+        rows = {}
+        for item in increments:
+            from_symbol = item['from_symbol']
+            to_symbol = item['to_symbol']
+            if from_symbol not in overrides and from_symbol not in default_weights:
+                raise ValidationError({"from_symbol": ["Invalid symbol (no such symbol)"]})
+            column = bisect_left(symbol_ids, to_symbol)
+            if column == len(symbol_ids) or symbol_ids[column] != to_symbol:
+                raise ValidationError({"to_symbol": ["Invalid symbol (no such symbol)"]})
+
+            if from_symbol not in rows:
+                if from_symbol in overrides:
+                    rows[from_symbol] = decode_weight(overrides[from_symbol])
+                else:
+                    rows[from_symbol] = default_weights[from_symbol]
+            row = rows[from_symbol]
+            row.extend([0] * (max(width, column + 1) - len(row)))
+            row[column] += item['delta']
+
+        to_store = []
+        to_reset = []
+        for symbol_id, row in rows.items():
+            try:
+                check_weight(row)
+            except ValueError:
+                raise ValidationError({"delta": ["weight out of range"]})
+
+            if matches_default(symbol_id, row):
+                to_reset.append(symbol_id)
+            else:
+                to_store.append(
+                    WeightTable(user=user, symbol_id=symbol_id, weight=encode_weight(row), version=new_version))
+
+        to_reset = [symbol_id for symbol_id in to_reset if symbol_id in overrides]
+        WeightTable.objects.filter(user=user, symbol_id__in=to_reset).delete()
+        WeightTable.objects.upsert(to_store)
+        record_tombstones(user, WEIGHTS, to_reset, new_version)
+        update_manifest(
+            user, WEIGHTS, new_version,
+            added=[weight_row(symbol_id, row) for symbol_id, row in rows.items()],
+            removed=[weight_row(symbol_id, decode_weight(overrides[symbol_id]) if symbol_id in overrides
+                                else default_weights[symbol_id]) for symbol_id in rows],
+        )
+
+        return bump_weight_table_version(user, version)
+
+    return atomic_with_retry(WEIGHTS, write)
+
+
+# Chunked upload (WeightUploadView and below): the staged rows go through
+# backup_weight_table on commit, so they get the same validation as a single POST
+
+def get_upload_session(user, pk, lock=False):
+    sessions = WeightUploadSession.objects.filter(id=pk, user=user)
+    if lock:
+        sessions = sessions.select_for_update()
+    session = sessions.first()
+    if session is None:
+        raise ValidationError({"upload_id": ["No such upload"]})
+    if session.created_at < timezone.now() - datetime.timedelta(seconds=settings.WEIGHT_UPLOAD_EXPIRES):
+        raise ValidationError({"upload_id": ["The upload has expired"]})
+    return session
+
+
+def commit_weight_upload(user, pk, chunk_count):
+    def write():
+        session = get_upload_session(user, pk, lock=True)
+        if session.version is not None:
+            return session.version  # the commit is retried
+
+        received = dict(session.chunks.values_list('number', 'rows'))
+        missing = [number for number in range(1, chunk_count + 1) if number not in received]
+        if missing:
+            raise ValidationError({"chunks": ["Missing chunks: {}".format(', '.join(map(str, missing)))]})
+        if len(received) > chunk_count:
+            raise ValidationError({"chunks": ["Received more than {} chunks".format(chunk_count)]})
+
+        rows = [row for number in sorted(received) for row in received[number]]
+        session.version = backup_weight_table(user, rows)
+        session.save(update_fields=['version'])
+        session.chunks.all().delete()
+        return session.version
+
+    return atomic_with_retry(WEIGHTS, write)
+
+
+def weight_table_etag(request, *args, **kwargs):
+    # The binary representations and the gzip stream are other entities than the JSON one
+    etag = section_etag(WEIGHTS)(request)
+    format = request.accepted_renderer.format
+    if format != 'json':
+        return '{}-{}'.format(etag, format)
+    if request.query_params.get('stream') and accepts_gzip(request):
+        return '{}-gzip'.format(etag)
+    return etag
+
+
+class NegotiatedView(APIView):
+    # For views with several renderers: the body depends on the Accept header,
+    # which shared caches must take into account
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+
+class WeightTableBackupView(NegotiatedView):
+    permission_classes = (permissions.IsAuthenticated,)
+    # JSON stays the default; the other formats are chosen with Accept / Content-Type
+    renderer_classes = (JSONRenderer, MessagePackRenderer, WeightMatrixRenderer)
+    parser_classes = (JSONParser, MessagePackParser, WeightMatrixParser)
+
+    @idempotent
+    def post(self, request):
+        if not isinstance(request.data, dict):
+            raise ValidationError({"weight_table": ["Expected an object with a list of rows"]})
+        response_data = {
+            "version": backup_weight_table(request.user, request.data.get('weight_table'))
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+    @method_decorator(condition(etag_func=weight_table_etag))
+    def get(self, request):
+        binary = request.accepted_renderer.format != 'json'
+        since = parse_since(request)
+        # ?stream=1: a full JSON restore built row by row instead of in memory
+        if since is None and not binary and request.query_params.get('stream'):
+            return weight_table_streaming_response(request)
+
+        response_data = get_weight_table(request.user, since, binary=binary)
+        return Response(response_data, status=status.HTTP_200_OK)
 
 
-class WeightTableBackupView(APIView):
+# Apply a batch of count changes instead of re-uploading the whole table
+class WeightIncrementView(NegotiatedView):
     permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = (JSONRenderer, MessagePackRenderer)
+    parser_classes = (JSONParser, MessagePackParser)
 
+    @idempotent
     def post(self, request):
         user = request.user
-        data = request.data.get('weight_table')
+        if not isinstance(request.data, dict):
+            raise ValidationError({"increments": ["Expected an object with a list of increments"]})
+        data = request.data.get('increments')
 
-        serializer = WeightTableBackupSerializer(data=data, context={'user': user}, many=True)
+        serializer = WeightIncrementSerializer(data=data, many=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
 
-        # Delete weight rows if user deleted corresponding symbols
-        weight_symbols = WeightTable.objects.filter(user=user).values('symbol_id')
-        weight_to_delete = [item['symbol_id'] for item in weight_symbols]
+        response_data = {
+            "version": increment_weight_table(user, serializer.validated_data)
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+# Chunked upload, step 1: open a session
+class WeightUploadView(NegotiatedView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request):
+        user = request.user
+
+        expired = timezone.now() - datetime.timedelta(seconds=settings.WEIGHT_UPLOAD_EXPIRES)
+        WeightUploadSession.objects.filter(user=user, created_at__lt=expired).delete()
+        session = WeightUploadSession.objects.create(user=user)
+
+        response_data = {
+            "upload_id": session.id,
+            "expires_in": settings.WEIGHT_UPLOAD_EXPIRES
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
 
-        try:
-            for item in serializer.validated_data:
-                weight_to_delete.remove(item.get('symbol_id'))
-        except ValueError:
-            pass
+# Which chunks arrived, to resume an upload after a dropped connection
+class WeightUploadSessionView(NegotiatedView):
+    permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = (JSONRenderer, MessagePackRenderer)
+
+    def get(self, request, pk):
+        session = get_upload_session(request.user, pk)
+        response_data = {
+            "upload_id": session.id,
+            "received": sorted(session.chunks.values_list('number', flat=True)),
+            "version": session.version
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
 
-        for id in weight_to_delete:
-            WeightTable.objects.get(symbol_id=id, user=user).delete()
 
-        return Response(status=status.HTTP_200_OK)
+# Chunked upload, step 2: PUT chunk 1, 2, ... in any order; sending a chunk again replaces it
+class WeightUploadChunkView(NegotiatedView):
+    permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = (JSONRenderer, MessagePackRenderer)
+    parser_classes = (JSONParser, MessagePackParser, WeightMatrixParser)
+
+    def put(self, request, pk, number):
+        max_chunks = settings.WEIGHT_UPLOAD_MAX_CHUNKS
+        if not 1 <= number <= max_chunks:
+            raise ValidationError({"number": ["Chunks are numbered from 1 to {}".format(max_chunks)]})
+        rows = request.data.get('weight_table') if isinstance(request.data, dict) else None
+        if not isinstance(rows, list):
+            raise ValidationError({"weight_table": ["Expected a list of rows"]})
+
+        # Under the session's lock, so a chunk cannot land after a concurrent commit read the chunks
+        with transaction.atomic():
+            session = get_upload_session(request.user, pk, lock=True)
+            if session.version is not None:
+                raise ValidationError({"upload_id": ["The upload is already committed"]})
+            WeightUploadChunk.objects.update_or_create(session=session, number=number, defaults={'rows': rows})
+
+        response_data = {
+            "number": number,
+            "rows": len(rows)
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+# Chunked upload, step 3: apply chunks 1 to `chunks` as one backup
+class WeightUploadCommitView(NegotiatedView):
+    permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = (JSONRenderer, MessagePackRenderer)
+    parser_classes = (JSONParser, MessagePackParser)
+
+    def post(self, request, pk):
+        serializer = WeightUploadCommitSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        response_data = {
+            "version": commit_weight_upload(request.user, pk, serializer.validated_data['chunks'])
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+# Top-k next symbols after the given one, computed from the user's weight table
+class WeightPredictView(NegotiatedView):
+    permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = (JSONRenderer, MessagePackRenderer)
 
     def get(self, request):
         user = request.user
-        weight_table = WeightTable.objects.filter(user=user)
-        response_data = WeightTableBackupSerializer(weight_table, many=True).data
+
+        serializer = WeightPredictSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        after = serializer.validated_data['after']
+        k = serializer.validated_data['k']
+
+        predictions = predict_next_symbols(user, after, k)
+        if predictions is None:
+            raise ValidationError({"after": ["Invalid symbol (no such symbol)"]})
+
         response_data = {
-            "weight_table": response_data
+            "results": [{"id": symbol_id, "weight": weight} for symbol_id, weight in predictions]
         }
         return Response(response_data, status=status.HTTP_200_OK)